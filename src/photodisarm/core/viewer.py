@@ -1,24 +1,33 @@
 import cv2
-import numpy as np
 import os
-import shutil
-from glob import glob
-from multiprocessing import Pool, cpu_count
 from collections import deque
-import asyncio
+import logging
 import threading
-import queue
 import time
 from tkinter import messagebox
 
 # Import your other modules
-from ..ui.canvas import display_message, put_text_utf8, resize_image
-from ..utils.util import center_window, sort_images_by_date, get_image_metadata_date, move_image_to_dir_with_date, get_images_rec, get_images
+from ..ui.canvas import put_text_utf8_multi, restore_regions, text_bbox
+from ..utils.util import (sort_images_by_date, prefetch_image_dates, get_date_dir_destination, get_free_path,
+                          list_image_stats, ensure_dir, prune_date_index, save_date_index)
 from ..processing.duplicates import duplicates
 from ..processing.corrupt import CorruptDetector
-from ..processing.image import Image_processing
 from ..i18n.localization import localization
-from ..processing.background import BackgroundProcessor
+from ..processing.background import BackgroundProcessor, FileMover
+
+logger = logging.getLogger(__name__)
+
+# How long each cv2.waitKeyEx poll waits before checking preload progress
+KEY_POLL_INTERVAL_MS = 10
+# Poll interval once preloading is done and only a closed window needs noticing
+IDLE_KEY_POLL_INTERVAL_MS = 100
+# How many images the left arrow can step back through
+HISTORY_SIZE = 1000
+
+# Image statuses shown in the viewer
+STATUS_SKIPPED = 0
+STATUS_SAVED = 1
+STATUS_DELETED = 2
 
 
 class ImageViewer:
@@ -27,7 +36,48 @@ class ImageViewer:
     def __init__(self):
         self.background_processor = None
         
-    async def process_images(self, image_paths: list, max_width: int, max_height: int, chunk_size: int = 50, output_dir: str = None, use_cache: bool = True, quality: str = 'normal', save_keybind: str = 'space', delete_keybind: str = 'backspace', sort_by_date: bool = True):
+    def _wait_for_key(self, window_name: str, progress_text: str) -> int:
+        """
+        Wait for a key press while keeping the window title updated with preload progress.
+        
+        Polls cv2.waitKeyEx with a short timeout instead of blocking indefinitely,
+        so the loader's progress is visible while the user looks at an image.
+        Once everything is preloaded the poll slows down, since it then only has
+        to notice the window being closed.
+        
+        Args:
+            window_name: Name of the OpenCV window
+            progress_text: Localized progress message with a {percent} placeholder
+            
+        Returns:
+            Key code, or -1 if the window was closed
+        """
+        last_progress = None
+        poll_interval = KEY_POLL_INTERVAL_MS
+        while True:
+            key = cv2.waitKeyEx(poll_interval)
+            if key != -1:
+                return key
+            
+            # The user closed the window
+            if cv2.getWindowProperty(window_name, cv2.WND_PROP_VISIBLE) < 1:
+                return -1
+            
+            if poll_interval == IDLE_KEY_POLL_INTERVAL_MS:
+                continue
+            progress = self.background_processor.preload_progress()
+            if progress != last_progress:
+                last_progress = progress
+                if progress < 100:
+                    title = f"{window_name} - {progress_text.format(percent=progress)}"
+                else:
+                    title = window_name
+                cv2.setWindowTitle(window_name, title)
+            if progress >= 100:
+                # Nothing left to report; a key press still returns immediately
+                poll_interval = IDLE_KEY_POLL_INTERVAL_MS
+        
+    def process_images(self, image_paths: list, max_width: int, max_height: int, chunk_size: int = 50, output_dir: str = None, use_cache: bool = True, quality: str = 'normal', save_keybind: str = 'space', delete_keybind: str = 'backspace', sort_by_date: bool = True, image_stats: dict = None):
         """
         Process images in chunks to reduce memory usage.
         
@@ -41,12 +91,16 @@ class ImageViewer:
             save_keybind: Key binding for saving images (default: 'space')
             delete_keybind: Key binding for deleting images (default: 'backspace')
             sort_by_date: Whether images are already sorted by date globally
+            image_stats: Optional dict of path -> os.stat_result from the directory scan,
+                reused when sorting chunks by date
         """
         index: int = 0
         total_images = len(image_paths)
-        # Use deque with maxlen=10 to automatically limit history size
-        history = deque(maxlen=10)
-        
+        # Indices into image_paths of the images the user moved on from; entries are
+        # rewritten in place when files move, so an index stays valid after a save/delete.
+        # Indices are cheap to keep, so the user can go back a long way
+        history = deque(maxlen=HISTORY_SIZE)
+
         # Key mapping function
         def get_key_code(key_name: str) -> int:
             """Map key names to OpenCV key codes"""
@@ -87,29 +141,56 @@ class ImageViewer:
         save_key_code = get_key_code(save_keybind)
         delete_key_code = get_key_code(delete_keybind)
   
-        # Helper function to determine image status based on path
-        def get_image_status(img_path: str) -> str:
-            """
-            Get the status text for an image based on its path
+        # What the user did with each image, indexed like image_paths
+        statuses = bytearray(total_images)
+        status_texts = {
+            STATUS_SKIPPED: localization.get_text("status_skipped"),
+            STATUS_SAVED: localization.get_text("status_saved"),
+            STATUS_DELETED: localization.get_text("status_deleted"),
+        }
+        status_colors = {
+            STATUS_SKIPPED: (255, 255, 255),  # White for skipped
+            STATUS_SAVED: (0, 255, 0),  # Green for saved
+            STATUS_DELETED: (0, 0, 255),  # Red (BGR format) for deleted
+        }
+        # Complete status overlays, ready to hand to put_text_utf8_multi. They start 150px
+        # from the right edge, further left if a translation is too long to fit
+        status_overlays = {
+            status: (text, (min(max_width - 150, max_width - 10 - text_bbox(text, 16)[2]), 30),
+                     16, status_colors[status], True)
+            for status, text in status_texts.items()
+        }
+        # Chunks (by start index) that were already sorted, so revisiting one keeps its order
+        sorted_chunks = set()
+        date_prefetch = None  # Thread reading the next chunk's Exif dates ahead of its sort
             
-            Args:
-                img_path: Path to the image file
-                
-            Returns:
-                Status text ('Saved', 'Deleted', or '')
-            """
-            if output_dir and output_dir in img_path and "Deleted" not in img_path:
-                return localization.get_text("status_saved")
-            elif "Deleted" in img_path:
-                return localization.get_text("status_deleted")
-            else:
-                return localization.get_text("status_skipped")
-            
-        cv2.namedWindow(localization.get_text("image_window"), cv2.WINDOW_NORMAL)
-        cv2.resizeWindow(localization.get_text("image_window"), max_width, max_height)
+        # The language can't change while viewing, so look the window texts up once
+        window_name = localization.get_text("image_window")
+        progress_text = localization.get_text("preloading_progress")
+        # Plain software-rendered window (never WINDOW_OPENGL): the frames are already in CPU
+        # memory, so a GL path would only add a texture upload/readback on every imshow
+        cv2.namedWindow(window_name, cv2.WINDOW_NORMAL | cv2.WINDOW_GUI_NORMAL | cv2.WINDOW_KEEPRATIO)
+        cv2.resizeWindow(window_name, max_width, max_height)
+        # Don't tie imshow to the display refresh where the backend supports turning vsync off
+        if hasattr(cv2, "WND_PROP_VSYNC"):
+            try:
+                cv2.setWindowProperty(window_name, cv2.WND_PROP_VSYNC, 0)
+            except cv2.error:
+                pass
         
         # Process images in chunks
         self.background_processor = BackgroundProcessor(max_queue_size=50)
+        # Saves and deletes are carried out in the background
+        file_mover = FileMover()
+        deleted_dir = os.path.join(output_dir, "Deleted") if output_dir else "Deleted"
+        
+        # Overlay text and positions that don't change while viewing
+        keybinding_text = f"{save_keybind.title()}: Gem | {delete_keybind.title()}: Slet | ← : Tilbage | → : Frem"
+        # Center it using its measured size
+        left, _, right, _ = text_bbox(keybinding_text, 18)
+        keybinding_position = ((max_width - (right - left)) // 2 - left, max_height - 30)
+        keybinding_overlay = (keybinding_text, keybinding_position, 18, (255, 255, 255), True)
+        position_text_position = (10, max_height - 30)
         
         while index < total_images:
             # Calculate the end index for current chunk
@@ -117,11 +198,24 @@ class ImageViewer:
               # Extract current chunk of image paths
             chunk_paths = image_paths[index:chunk_end]
             
+            # Files of this chunk may still be moving (e.g. when going back a chunk)
+            file_mover.wait()
+            
             # Sort this chunk by date only if global sorting wasn't done
-            if not sort_by_date:
-                chunk_paths = sort_images_by_date(chunk_paths)
+            if not sort_by_date and index not in sorted_chunks:
+                sorted_chunks.add(index)
+                if date_prefetch is not None:
+                    date_prefetch.join()  # Usually long done
+                chunk_paths = sort_images_by_date(chunk_paths, image_stats)
                 # Update the original list with the sorted chunk
                 image_paths[index:chunk_end] = chunk_paths
+                
+                # Read the next chunk's dates while the user works through this one
+                next_paths = image_paths[chunk_end:chunk_end + chunk_size]
+                if next_paths and chunk_end not in sorted_chunks:
+                    date_prefetch = threading.Thread(target=prefetch_image_dates, args=(next_paths, image_stats),
+                                                     name="date-prefetch", daemon=True)
+                    date_prefetch.start()
             
             # Start background processor for this chunk and prepare for next chunk
             self.background_processor.start(
@@ -144,143 +238,97 @@ class ImageViewer:
                 imagePath = image_paths[current_index]
                 
                 # Update background processor's current index for accurate prefetching
-                self.background_processor.current_index = current_chunk_index
+                self.background_processor.update_position(current_chunk_index)
                 
                 # Get image from background processor (it will process immediately if not preloaded)
                 start_time = time.time()
                 _, imageData = self.background_processor.get_image(imagePath)
                 load_time = time.time() - start_time
                 
-                if load_time < 0.1:
-                    print(f"Image loaded instantly from preload cache ({load_time:.3f}s)")
-                else:
-                    print(f"Image processed in {load_time:.3f}s")
+                if logger.isEnabledFor(logging.DEBUG):
+                    if load_time < 0.1:
+                        logger.debug("Image loaded instantly from preload cache (%.3fs)", load_time)
+                    else:
+                        logger.debug("Image processed in %.3fs", load_time)
                 
                 if imageData is None:
                     # Skip problematic images
                     current_chunk_index += 1
                     continue
                   
-                # Display info about current position and date
-                status_image = imageData.copy()
-                
-                # Try to get the image date
-                image_date = get_image_metadata_date(imagePath)
-                date_info = f"{image_date}" if image_date else localization.get_text("no_date")
-                
-                # Display position info in bottom left corner using custom UTF-8 text function
-                position_text = f"{localization.get_text('image_window')} {current_index + 1}/{total_images}"
-                status_image = put_text_utf8(
-                    status_image,
-                    position_text,
-                    position=(10, max_height - 30),
-                    font_size=18, 
-                    color=(255, 255, 255),
-                    thickness=2,
-                    with_background=True  # Add semi-transparent background
-                )
-                
-                # Display keybindings in bottom middle
-                keybinding_text = f"{save_keybind.title()}: Gem | {delete_keybind.title()}: Slet | ← : Tilbage | → : Frem"
-                # Calculate the center position (roughly)
-                text_width = len(keybinding_text) * 7  # Rough estimate for font size 18
-                center_x = (max_width - text_width) // 2
-                status_image = put_text_utf8(
-                    status_image,
-                    keybinding_text,
-                    position=(center_x, max_height - 30),
-                    font_size=18,
-                    color=(255, 255, 255),  # Yellow for better visibility
-                    thickness=2,
-                    with_background=True  # Add semi-transparent background
-                )
-                
-                # Add history counter in top left when there's history
-                current_status = get_image_status(imagePath)
-                if current_status:
-                    # Use different colors based on status
-                    if current_status == localization.get_text("status_saved"):
-                        status_color = (0, 255, 0)  # Green for saved
-                    elif current_status == localization.get_text("status_deleted"):
-                        status_color = (0, 0, 255)  # Red (BGR format) for deleted
-                    else:
-                        status_color = (255, 255, 255)  # White for skipped
-                            
-                    status_image = put_text_utf8(
-                        status_image,
-                        current_status,
-                        position=(max_width - 150, 30),
-                        font_size=16,
-                        color=status_color,
-                        thickness=2,
-                        with_background=True
-                    )
-
-                # Display date info in bottom right corner
-                status_image = put_text_utf8(
-                    status_image,
-                    date_info,
-                    position=(max_width - len(date_info) * 10 - 20, max_height - 30),
-                    font_size=18,
-                    color=(255, 255, 255),
-                    thickness=2,
-                    with_background=True  # Add semi-transparent background
-                )
-            
-                cv2.imshow(localization.get_text("image_window"), status_image)
-                key = cv2.waitKeyEx(0)
-                print(key)
+                # Display info about current position (the date is already drawn by the background processor).
+                # The overlays go straight onto the cached frame and are undone once imshow has
+                # copied it into the window, so the frame is never copied as a whole
+                position_text = f"{window_name} {current_index + 1}/{total_images}"
+                saved_regions = []
+                put_text_utf8_multi(imageData, (
+                    (position_text, position_text_position, 18, (255, 255, 255), True),
+                    keybinding_overlay,
+                    status_overlays[statuses[current_index]],
+                ), saved_regions)
+                try:
+                    cv2.imshow(window_name, imageData)
+                finally:
+                    restore_regions(imageData, saved_regions)
+                key = self._wait_for_key(window_name, progress_text)
+                logger.debug("Key pressed: %s", key)
                 
                 if key in (81, 2424832, 37, 65361):  # Left arrow key codes
+                    # The previous image may have just been moved
+                    file_mover.wait()
                     if len(history) > 0:  # Only go back if history isn't empty
-                        prev_original_path = history.pop()
+                        prev_index = history.pop()
+                        
+                        # A save/delete that failed left the file where it was
+                        prev_path = image_paths[prev_index]
+                        actual_path = file_mover.resolve(prev_path)
+                        if actual_path != prev_path:
+                            image_paths[prev_index] = actual_path
+                            statuses[prev_index] = STATUS_SKIPPED
+                            self.background_processor.rename(prev_path, actual_path)
                         
                         # Update the current position to show the previous image
-                        # We need to find the index of the previous image in image_paths
-                        try:
-                            prev_index = image_paths.index(prev_original_path)
-                            # Adjust chunk indices if necessary
-                            if prev_index < index:
-                                # Need to go back to previous chunk
-                                new_chunk_start = (prev_index // chunk_size) * chunk_size
-                                index = new_chunk_start
-                                current_chunk_index = prev_index - new_chunk_start
-                            else:
-                                # Same chunk
-                                current_chunk_index = prev_index - index
-                        except ValueError:
-                            # Image not found in list, just go back one
-                            if current_chunk_index > 0:
-                                current_chunk_index -= 1
-                            elif index > 0:
-                                index -= chunk_size
-                                current_chunk_index = chunk_size - 1
+                        # Adjust chunk indices if necessary
+                        if prev_index < index:
+                            # Need to go back to previous chunk
+                            new_chunk_start = (prev_index // chunk_size) * chunk_size
+                            index = new_chunk_start
+                            current_chunk_index = prev_index - new_chunk_start
+                        else:
+                            # Same chunk
+                            current_chunk_index = prev_index - index
                     else:
-                        print("History limit reached, cannot go back further")
+                        logger.debug("History limit reached, cannot go back further")
                     
                     # Skip the rest of the processing for this loop
                     continue
                 elif key in (83, 2555904, 39, 65363): # Right arrow key codes
                     # For any other key, store in history as skipped and move to next image
-                    history.append(imagePath)
+                    history.append(current_index)
                     current_chunk_index += 1
                 # Store current image in history before processing action
                 if key == save_key_code:  # Configurable save key
-                    history.append(imagePath)
-                    new_path = move_image_to_dir_with_date(imagePath, output_dir)
+                    history.append(current_index)
+                    statuses[current_index] = STATUS_SAVED
+                    new_path = get_date_dir_destination(imagePath, output_dir, file_mover.pending_destinations())
+                    file_mover.move(imagePath, new_path)
                     # Update the path in the original list
                     image_paths[current_index] = new_path
+                    self.background_processor.rename(imagePath, new_path)
                     current_chunk_index += 1
                 elif key == delete_key_code:  # Configurable delete key
-                    history.append(imagePath)
-                    deleted_dir = os.path.join(output_dir, "Deleted") if output_dir else "Deleted"
-                    os.makedirs(deleted_dir, exist_ok=True)
-                    image_name = os.path.basename(imagePath)
-                    new_path = os.path.join(deleted_dir, image_name)
-                    shutil.move(imagePath, new_path)
+                    history.append(current_index)
+                    statuses[current_index] = STATUS_DELETED
+                    # Created on the first delete (ensure_dir only touches the disk once); an
+                    # earlier deleted image with the same name is not overwritten
+                    new_path = get_free_path(ensure_dir(deleted_dir), os.path.basename(imagePath),
+                                             file_mover.pending_destinations())
+                    file_mover.move(imagePath, new_path)
                     image_paths[current_index] = new_path
+                    self.background_processor.rename(imagePath, new_path)
                     current_chunk_index += 1                
                 elif key == 27 or key == -1:  # Esc key
+                    file_mover.wait()  # Finish pending saves/deletes
                     if self.background_processor:
                         self.background_processor.stop()  # Stop background processing
                     cv2.destroyAllWindows()
@@ -290,6 +338,7 @@ class ImageViewer:
             # Move to the next chunk
             index = chunk_end
           # All chunks processed
+        file_mover.wait()
         if self.background_processor:
             self.background_processor.stop()  # Stop background processing
         messagebox.showinfo(localization.get_text("done"), localization.get_text("all_processed"))
@@ -320,16 +369,19 @@ class ImageViewer:
             messagebox.showerror(localization.get_text("error"), localization.get_text("invalid_dir"))
             return
 
-        image_paths = []
         # Create output directory if it doesn't exist
         if not os.path.exists(output_dir):
-            os.makedirs(output_dir, exist_ok=True)        
-        if recursive:
-            for chunk in get_images_rec(input_dir):
-                image_paths.extend(chunk)
-        else:
-            for chunk in get_images(input_dir):
-                image_paths.extend(chunk)
+            os.makedirs(output_dir, exist_ok=True)
+        # Saves are a quick rename on the same drive, but a full copy on another one
+        if os.stat(input_dir).st_dev != os.stat(output_dir).st_dev:
+            print("Warning: the output directory is on a different drive than the input directory, "
+                  "so saved images are copied instead of moved. Pick an output directory on the same drive for faster saving.")
+        # One directory walk straight into a flat list (no per-chunk lists to merge); the
+        # stat results from the walk are reused by the date sort
+        image_stats = list_image_stats(input_dir, recursive=recursive)
+        image_paths = list(image_stats)
+        # Forget the dates of images that were moved out or deleted since the last run
+        prune_date_index(input_dir, image_paths, recursive)
         
         print(f"Found {len(image_paths)} images")
         
@@ -342,7 +394,7 @@ class ImageViewer:
         # Sort all images by date if requested
         if sort_by_date:
             print("Sorting all images by date...")
-            image_paths = sort_images_by_date(image_paths)
+            image_paths = sort_images_by_date(image_paths, image_stats)
             print("Images sorted by date")
         
         if move_duplicates:
@@ -352,4 +404,8 @@ class ImageViewer:
         print(f"Processing {len(image_paths)} images in chunks of {chunk_size}")
         print(f"Image quality: {quality}, Cache enabled: {use_cache}")
           # Pass all parameters to process_images
-        asyncio.run(self.process_images(image_paths, max_width, max_height, chunk_size, output_dir, use_cache, quality, save_keybind, delete_keybind, sort_by_date))
+        try:
+            self.process_images(image_paths, max_width, max_height, chunk_size, output_dir, use_cache, quality, save_keybind, delete_keybind, sort_by_date, image_stats)
+        finally:
+            # The date index is written once per session
+            save_date_index()
@@ -52,6 +52,7 @@ class LocalizationService:
             "options_settings": "Options",
             "quality_settings": "Image Quality Settings",
             "preloading": "Preloading next images in background...",
+            "preloading_progress": "Preloading {percent}%",
             "loaded_from_cache": "Image loaded from preload cache",            "status_saved": "Saved",
             "status_deleted": "Deleted",            "status_skipped": "",
             "status_history": "History: {count}/10",
@@ -95,6 +96,7 @@ class LocalizationService:
             "options_settings": "Indstillinger",
             "quality_settings": "Billedkvalitetsindstillinger",
             "preloading": "Forudindlæser næste billeder i baggrunden...",
+            "preloading_progress": "Forudindlæser {percent}%",
             "loaded_from_cache": "Billede indlæst fra forudindlæsningscache",            "status_saved": "Gemt",
             "status_deleted": "Slettet",            "status_skipped": "",
             "status_history": "Historik: {count}/10",
@@ -1,22 +1,45 @@
-import cv2
-import numpy as np
-import os
-import shutil
-from glob import glob
-from multiprocessing import Pool, cpu_count
-import tkinter as tk
-from tkinter import filedialog, messagebox
 from collections import deque
-import asyncio
-import threading
+import logging
+import math
+import os
+from multiprocessing import cpu_count
 import queue
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, CancelledError
 from photodisarm.processing.image import Image_processing
+from photodisarm.ui.canvas import draw_date_overlay
+from photodisarm.utils.util import get_image_date, move_file
+from photodisarm.i18n.localization import localization
+
+logger = logging.getLogger(__name__)
+
+_HAS_FADVISE = hasattr(os, "posix_fadvise")
+# Weight of the newest sample in the decode time and key press interval averages
+RATE_SMOOTHING = 0.1
+# Key press intervals longer than this are the user pausing, not browsing speed
+MAX_KEY_INTERVAL = 5.0
+# Recently displayed frames kept across chunk changes, so going back doesn't redecode
+RECENT_FRAMES = 20
+
+
+def _advise_willneed(paths):
+    """Ask the OS to start reading the given files into the page cache (POSIX only)."""
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass  # The hint is best-effort; the decode will report real errors
+
 
 class BackgroundProcessor:
-    def __init__(self, max_queue_size=50):  # Increased queue size to handle full chunks
-        self.image_queue = queue.Queue(maxsize=max_queue_size)
-        self.processing_thread = None
+    def __init__(self, max_queue_size=50, max_workers=None):
+        # max_queue_size is accepted for backwards compatibility; decoded images are
+        # handed over through the processed_images cache, not a queue
         self.running = False
         self.current_chunk = []
         self.next_chunk = []
@@ -26,205 +49,414 @@ class BackgroundProcessor:
         self.max_height = 800
         self.use_cache = True
         self.quality = 'normal'
+        self.no_date_text = localization.get_text("no_date")
         self.processed_images = {}  # In-memory cache for current session
+        # OpenCV, libjpeg-turbo and rawpy release the GIL while decoding, so the workers
+        # really run in parallel; capped to bound the memory of in-flight full-size decodes
+        self.max_workers = max_workers or max(1, min(8, cpu_count() - 1))
+        self._executor = None
+        self._pending = {}  # path -> Future for decodes currently in flight
+        self._wanted = set()  # paths in the current and next chunk
+        self._lookahead_chunk = []  # chunk after next, only hinted to the OS
+        self._lookahead_advised = False
+        self._recent = deque(maxlen=RECENT_FRAMES)  # paths of the last displayed images
+        # Moving averages (seconds) used to decide how far into the next chunk to decode
+        self._decode_time = None
+        self._key_interval = None
+        self._last_position_time = None
+        # Guards processed_images, _pending and the chunk lists, which are shared with the workers
+        self._lock = threading.Lock()
     def start(self, image_paths, current_index, max_width, max_height, use_cache=True, quality='normal', chunk_size=25, all_paths=None, current_chunk_idx=0):
-        """Start background processing thread with the given parameters"""
-        self.stop()  # Ensure any previous thread is stopped
-        
-        self.current_chunk = image_paths
-        self.current_index = current_index
-        self.max_width = max_width
-        self.max_height = max_height
-        self.use_cache = use_cache
-        self.quality = quality
-        self.chunk_size = chunk_size
-        self.running = True
-        
-        # Prepare next chunk if all_paths is provided
-        if all_paths is not None and len(all_paths) > (current_chunk_idx + 1) * chunk_size:
-            next_start = (current_chunk_idx + 1) * chunk_size
-            next_end = min(next_start + chunk_size, len(all_paths))
-            self.next_chunk = all_paths[next_start:next_end]
-            print(f"Preparing to preload next chunk ({len(self.next_chunk)} images)")
-        else:
-            self.next_chunk = []
+        """
+        Point background processing at a new chunk.
         
-        # Clear the queue and in-memory cache (keep only what's still needed)
-        self.processed_images = {path: img for path, img in self.processed_images.items() 
-                               if path in self.current_chunk or path in self.next_chunk}
+        The worker pool is created on the first call and then kept alive across
+        chunks, so moving to the next chunk only swaps the work lists.
+        """
+        # Prepare next chunk if all_paths is provided. The chunk after that is not
+        # decoded (to bound memory) but gets an OS read-ahead hint once the user is
+        # halfway through the current chunk.
+        next_chunk = []
+        lookahead_chunk = []
+        if all_paths is not None:
+            next_start = (current_chunk_idx + 1) * chunk_size
+            next_chunk = all_paths[next_start:next_start + chunk_size]
+            lookahead_chunk = all_paths[next_start + chunk_size:next_start + 2 * chunk_size]
         
-        while not self.image_queue.empty():
-            try:
-                self.image_queue.get_nowait()
-            except queue.Empty:
-                break
+        with self._lock:
+            # Take copies so later edits to the caller's lists can't race the workers
+            self.current_chunk = list(image_paths)
+            self.next_chunk = next_chunk
+            self.current_index = current_index
+            self._lookahead_chunk = lookahead_chunk
+            self._lookahead_advised = False
+            self.max_width = max_width
+            self.max_height = max_height
+            self.use_cache = use_cache
+            self.quality = quality
+            # Looked up here rather than for every decoded image
+            self.no_date_text = localization.get_text("no_date")
+            self.chunk_size = chunk_size
+            self.running = True
+            
+            # Drop cached images that are no longer needed, except the last few shown
+            self._wanted = set(self.current_chunk)
+            self._wanted.update(self.next_chunk)
+            keep = self._wanted.union(self._recent)
+            self.processed_images = {path: img for path, img in self.processed_images.items() 
+                                   if path in keep}
+            # Queued decodes for images outside the new window are stale (e.g. after
+            # going back a chunk); running ones can't be interrupted and just finish
+            stale = [path for path in self._pending if path not in self._wanted]
+            stale_futures = [self._pending.pop(path) for path in stale]
                 
-        # Start processing thread
-        self.processing_thread = threading.Thread(target=self._process_images, daemon=True)
-        self.processing_thread.start()
+            # Create the worker pool once; later chunks reuse it
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="preload")
+        
+        for future in stale_futures:
+            future.cancel()
+        
+        logger.debug("Background processor started - caching %d images in current chunk and %d images in next chunk",
+                     len(self.current_chunk), len(self.next_chunk))
+        
+        self._schedule()
         
-        # Print status
-        print(f"Background processor started - caching {len(self.current_chunk)} images in current chunk " + 
-             f"and {len(self.next_chunk)} images in next chunk")
+    def update_position(self, current_index):
+        """
+        Tell the processor which image of the current chunk is being displayed.
         
+        Once the user is halfway through the chunk, the files of the chunk after
+        the next one are hinted to the OS so they are in the page cache by the
+        time they are decoded.
+        
+        Args:
+            current_index: Index of the displayed image within the current chunk
+        """
+        now = time.perf_counter()
+        with self._lock:
+            if self._last_position_time is not None and current_index != self.current_index:
+                interval = min(now - self._last_position_time, MAX_KEY_INTERVAL)
+                self._key_interval = self._smooth(self._key_interval, interval)
+            self._last_position_time = now
+            self.current_index = current_index
+        # Start on the images after the new position if a worker is free
+        self._schedule()
+        
+        with self._lock:
+            if self._lookahead_advised or current_index < len(self.current_chunk) // 2:
+                return
+            self._lookahead_advised = True
+            lookahead = self._lookahead_chunk
+        if lookahead and _HAS_FADVISE:
+            threading.Thread(target=_advise_willneed, args=(lookahead,), daemon=True).start()
+
+    def preload_progress(self):
+        """
+        Get how much of the current and next chunk has been preloaded.
+        
+        Returns:
+            Percentage (0-100) of wanted images that are decoded and cached
+        """
+        with self._lock:
+            wanted = self.current_chunk + self.next_chunk[:self._next_chunk_depth()]
+            if not wanted:
+                return 100
+            done = sum(1 for path in wanted if path in self.processed_images)
+            return done * 100 // len(wanted)
+
+    @staticmethod
+    def _smooth(average, sample):
+        """Fold a new sample into an exponential moving average"""
+        if average is None:
+            return sample
+        return average + RATE_SMOOTHING * (sample - average)
+
+    def _next_chunk_depth(self):
+        """
+        Get how many images of the next chunk should be decoded by now. Call with _lock held.
+        
+        Enough images are kept decoded ahead of the current one to cover the images the
+        user flips through while one decode runs, plus one round of work for every
+        worker. A user who browses slowly doesn't get the whole next chunk decoded into
+        memory long before it is needed.
+        
+        Returns:
+            Number of images from the start of the next chunk
+        """
+        if self._decode_time is None or not self._key_interval:
+            return len(self.next_chunk)  # No measurements yet
+        depth = math.ceil(self._decode_time / self._key_interval) + self.max_workers
+        remaining = len(self.current_chunk) - self.current_index - 1
+        return max(0, depth - remaining)
+
     def stop(self):
         """Stop the background processing"""
-        self.running = False
-        if self.processing_thread and self.processing_thread.is_alive():
-            self.processing_thread.join(timeout=0.5)  # Wait briefly for thread to finish
+        with self._lock:
+            self.running = False
+            pending = list(self._pending.values())
+            self._pending.clear()
+            executor, self._executor = self._executor, None
         
-        # Clear the queue
-        while not self.image_queue.empty():
-            try:
-                self.image_queue.get_nowait()
-            except queue.Empty:
-                break
+        # Drop queued decodes; ones already running finish in the background
+        for future in pending:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def rename(self, old_path, new_path):
+        """
+        Re-key a cached image after its file was moved.
+        
+        The viewer rewrites image_paths when an image is saved or deleted, so going
+        back to it asks for the new path; this keeps that lookup a cache hit.
+        
+        Args:
+            old_path: Path the image was cached under
+            new_path: Path the file was moved to
+        """
+        with self._lock:
+            if old_path in self.processed_images:
+                self.processed_images[new_path] = self.processed_images.pop(old_path)
+            if old_path in self._wanted:
+                self._wanted.discard(old_path)
+                self._wanted.add(new_path)
+            if old_path in self._recent:
+                self._recent[self._recent.index(old_path)] = new_path
+            # The renamed image is almost always the one being shown
+            if self.current_index < len(self.current_chunk) and self.current_chunk[self.current_index] == old_path:
+                self.current_chunk[self.current_index] = new_path
+                return
+            for chunk in (self.current_chunk, self.next_chunk):
+                if old_path in chunk:
+                    chunk[chunk.index(old_path)] = new_path
 
     def get_image(self, image_path):
-        """Get a processed image either from the cache, queue or by processing it now"""
-        # First check our in-memory cache
-        if image_path in self.processed_images:
-            return image_path, self.processed_images[image_path]
-        
-        # Then check if this image is already in the queue
-        temp_queue = []
-        found = False
-        found_data = None
-        
-        # Search through the queue
-        while not self.image_queue.empty() and not found:
-            try:
-                path, img = self.image_queue.get_nowait()
-                if path == image_path:
-                    # Found it!
-                    found = True
-                    found_data = img
-                    # Save to in-memory cache for future
-                    self.processed_images[path] = img
-                else:
-                    # Store temporarily
-                    temp_queue.append((path, img))
-            except queue.Empty:
-                break
-        
-        # Put everything back in the queue
-        for item in temp_queue:
+        """Get a processed image either from the cache, an in-flight preload or by processing it now"""
+        # First check our in-memory cache and the decodes already running
+        with self._lock:
+            if image_path in self._recent:
+                self._recent.remove(image_path)
+            self._recent.append(image_path)
+            if image_path in self.processed_images:
+                return image_path, self.processed_images[image_path]
+            future = self._pending.get(image_path)
+            max_width, max_height = self.max_width, self.max_height
+            use_cache, quality = self.use_cache, self.quality
+            no_date_text = self.no_date_text
+        
+        # Wait for the preload instead of decoding the same image twice
+        if future is not None:
             try:
-                self.image_queue.put(item)
-            except queue.Full:
-                # Queue is full, save to in-memory cache at least
-                self.processed_images[item[0]] = item[1]
-        
-        # If we found it, return it
-        if found:
-            return image_path, found_data
-        
-        # If we didn't find it, process it now (blocking)
-        print(f"Processing image now (not preloaded): {image_path}")
-        path, img_data = Image_processing.process_image(
-            image_path,
-            self.max_width,
-            self.max_height,
-            use_cache=self.use_cache,
-            quality=self.quality
-        )
+                return image_path, future.result()
+            except CancelledError:
+                pass
         
-        # Add to in-memory cache
-        if img_data is not None:
-            self.processed_images[path] = img_data
-            
-        return path, img_data
-    def _process_images(self):
-        """Background thread that processes upcoming images in both current and next chunk"""
+        # If we didn't find it, process it now (blocking). The decode is registered
+        # as pending so the preloader doesn't start the same image on a worker.
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            self._pending[image_path] = future
+        
+        logger.debug("Processing image now (not preloaded): %s", image_path)
+        img_data = None
         try:
-            # First, cache all images in the current chunk
-            current_chunk_processed = 0
-            next_chunk_processed = 0
+            _, img_data = Image_processing.process_image(
+                image_path,
+                max_width,
+                max_height,
+                use_cache=use_cache,
+                quality=quality
+            )
+            if img_data is not None:
+                img_data = self._add_date_overlay(image_path, img_data, max_width, max_height, no_date_text)
+        finally:
+            with self._lock:
+                if self._pending.get(image_path) is future:
+                    del self._pending[image_path]
+                # Add to in-memory cache
+                if img_data is not None:
+                    self.processed_images[image_path] = img_data
+            future.set_result(img_data)
             
-            while self.running:
-                # Process strategy:
-                # 1. Process all remaining images in current chunk
-                # 2. Process all images in next chunk
-                # 3. If both are done, sleep briefly
-                
-                # First priority: process remaining images in current chunk
-                unprocessed_current = [p for p in self.current_chunk if p not in self.processed_images]
-                
-                if unprocessed_current:
-                    img_path = unprocessed_current[0]
-                    # Prioritize NEF files
-                    if img_path.lower().endswith('.nef') or len([p for p in unprocessed_current if p.lower().endswith('.nef')]) == 0:
-                        
-                            # Process the image if not in memory cache already
-                            if img_path not in self.processed_images:
-                                print(f"Preloading current chunk image: {os.path.basename(img_path)}")
-                                path, img_data = Image_processing.process_image(
-                                    img_path,
-                                    self.max_width,
-                                    self.max_height,
-                                    use_cache=self.use_cache, 
-                                    quality=self.quality
-                                )
-                                
-                                if img_data is not None:
-                                    # Store in in-memory cache
-                                    self.processed_images[path] = img_data
-                                    current_chunk_processed += 1
-                                    
-                                    # Also try to add to queue if there's room
-                                    try:
-                                        if not self.image_queue.full():
-                                            self.image_queue.put((path, img_data))
-                                    except:
-                                        pass  # Queue operations can fail, but we have the in-memory cache as backup
-                                else:
-                                    print(f"Skipping current chunk image: {os.path.basename(img_path)}")
-                                    self.processed_images[img_path] = None
-                                    current_chunk_processed += 1
+        return image_path, img_data
 
-                
-                # Second priority: process next chunk
-                elif self.next_chunk:
-                    unprocessed_next = [p for p in self.next_chunk if p not in self.processed_images]
-                    
-                    if unprocessed_next:
-                        img_path = unprocessed_next[0]
-                        # Prioritize NEF files
-                        if img_path.lower().endswith('.nef') or len([p for p in unprocessed_next if p.lower().endswith('.nef')]) == 0:
-                                if img_path not in self.processed_images:
-                                    print(f"Preloading next chunk image: {os.path.basename(img_path)}")
-                                    path, img_data = Image_processing.process_image(
-                                        img_path,
-                                        self.max_width,
-                                        self.max_height,
-                                        use_cache=self.use_cache, 
-                                        quality=self.quality
-                                    )
-                                    
-                                    if img_data is not None:
-                                        # Store in in-memory cache
-                                        self.processed_images[path] = img_data
-                                        next_chunk_processed += 1
-                                    else:
-                                        print(f"Error, Skipping next chunk image: {os.path.basename(img_path)}")
-                                        self.processed_images[path] = None
-                                        next_chunk_processed += 1
-                    else:
-                        # Done with next chunk
-                        if next_chunk_processed > 0:
-                            print(f"Finished preloading all {next_chunk_processed} images in next chunk")
-                            next_chunk_processed = 0  # Reset counter
-                else:
-                    # Both chunks fully processed
-                    if current_chunk_processed > 0:
-                        print(f"Finished preloading all {current_chunk_processed} images in current chunk")
-                        current_chunk_processed = 0  # Reset counter
-                        
-                    # Nothing to do, sleep briefly
-                    time.sleep(0.5)
-        
-                # Brief pause between images
-                time.sleep(0.01)
+    def _next_preload_paths(self, count):
+        """
+        Pick the next images to preload. Must be called with the lock held.
+        
+        The images right after the one on screen come first, in display order, so
+        the next key press is the one most likely to find its image ready. The rest
+        of the current chunk follows with NEF files (the slowest to decode) first,
+        then images before the current position, then the next chunk.
+        
+        Args:
+            count: Maximum number of paths to return
+            
+        Returns:
+            List of paths that are neither cached nor already being decoded
+        """
+        def unprocessed(paths):
+            return [p for p in paths if p not in self.processed_images and p not in self._pending]
+        
+        def nef_first(paths):
+            return ([p for p in paths if p.lower().endswith('.nef')] +
+                    [p for p in paths if not p.lower().endswith('.nef')])
+        
+        upcoming = unprocessed(self.current_chunk[self.current_index:])
+        selected = upcoming[:self.max_workers]
+        selected.extend(nef_first(upcoming[self.max_workers:]))
+        selected.extend(nef_first(unprocessed(self.current_chunk[:self.current_index])))
+        if len(selected) < count:
+            selected.extend(nef_first(unprocessed(self.next_chunk[:self._next_chunk_depth()])))
+        return selected[:count]
+
+    def _schedule(self):
+        """Keep the worker pool busy with upcoming images until both chunks are cached."""
+        submitted = []
+        with self._lock:
+            if not self.running or self._executor is None:
+                return
+            free_workers = self.max_workers - len(self._pending)
+            if free_workers <= 0:
+                return
+            settings = (self.max_width, self.max_height, self.use_cache, self.quality, self.no_date_text)
+            started = time.perf_counter()  # Only free workers get work, so it starts right away
+            for img_path in self._next_preload_paths(free_workers):
+                future = self._executor.submit(self._preload_image, img_path, *settings)
+                self._pending[img_path] = future
+                submitted.append((img_path, future))
+        
+        # Register callbacks outside the lock: they run immediately if the decode already finished
+        for img_path, future in submitted:
+            future.add_done_callback(lambda f, p=img_path: self._on_preloaded(p, f, started))
+
+    @staticmethod
+    def _preload_image(img_path, max_width, max_height, use_cache, quality, no_date_text):
+        """Decode one image on a worker thread"""
+        logger.debug("Preloading image: %s", img_path)
+        _, img_data = Image_processing.process_image(
+            img_path,
+            max_width,
+            max_height,
+            use_cache=use_cache, 
+            quality=quality
+        )
+        if img_data is None:
+            logger.debug("Skipping image: %s", img_path)
+            return None
+        return BackgroundProcessor._add_date_overlay(img_path, img_data, max_width, max_height, no_date_text)
+
+    @staticmethod
+    def _add_date_overlay(img_path, img_data, max_width, max_height, no_date_text):
+        """
+        Burn the image date into a decoded frame.
+        
+        Done here rather than in the display loop so the date lookup and the text
+        rendering happen on a worker thread instead of between key presses. The
+        date usually comes from the index built when the images were sorted.
+        """
+        try:
+            image_date = get_image_date(img_path)
         except Exception as e:
-            print(f"Background processing error: {e}")    # Create a global instance of the background processor
-background_processor = BackgroundProcessor(max_queue_size=50)
\ No newline at end of file
+            print(f"Could not read date for {img_path}: {e}")
+            image_date = None
+        date_info = f"{image_date}" if image_date else no_date_text
+        return draw_date_overlay(img_data, date_info, max_width, max_height)
+
+    def _on_preloaded(self, img_path, future, started):
+        """Store a finished preload in the cache and start the next one"""
+        if future.cancelled():
+            return
+        elapsed = time.perf_counter() - started
+        try:
+            img_data = future.result()
+        except Exception as e:
+            print(f"Background processing error: {e}")
+            img_data = None
+        
+        with self._lock:
+            if self._pending.get(img_path) is future:
+                del self._pending[img_path]
+            self._decode_time = self._smooth(self._decode_time, elapsed)
+            # Store in in-memory cache (None marks images that failed to load)
+            if self.running and img_path in self._wanted:
+                self.processed_images[img_path] = img_data
+        
+        self._schedule()
+
+
+class FileMover:
+    """
+    Moves files on a background thread so key presses don't wait on the filesystem.
+    
+    Moves run one at a time in the order they were requested. Call wait() before
+    reading a file that may still be moving, and before the program exits.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = set()  # destinations of moves that haven't finished
+        self._failed = {}  # destination -> source of moves that failed
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def move(self, src, dst):
+        """
+        Queue a file move.
+        
+        Args:
+            src: Path of the file to move
+            dst: Destination file path
+        """
+        with self._lock:
+            self._pending.add(dst)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="file-mover", daemon=True)
+                self._thread.start()
+        self._queue.put((src, dst))
+
+    def pending_destinations(self):
+        """Get the destinations of moves that are still queued or running"""
+        with self._lock:
+            return set(self._pending)
+
+    def wait(self):
+        """Block until every queued move has finished"""
+        self._queue.join()
+
+    def resolve(self, path):
+        """
+        Get where a file that was queued to move to path actually is.
+        
+        Callers update their paths as soon as a move is queued; if the move then
+        failed, the file is still at its source.
+        
+        Args:
+            path: Destination path a move was queued for
+            
+        Returns:
+            The source path if that move failed, otherwise path
+        """
+        with self._lock:
+            return self._failed.pop(path, path)
+
+    def _run(self):
+        """Worker loop that performs the queued moves"""
+        while True:
+            src, dst = self._queue.get()
+            try:
+                move_file(src, dst)
+            except Exception as e:
+                print(f"Error moving {src} to {dst}: {e}")
+                with self._lock:
+                    self._failed[dst] = src
+            finally:
+                with self._lock:
+                    self._pending.discard(dst)
+                self._queue.task_done()
+
+
+# Create a global instance of the background processor
+background_processor = BackgroundProcessor(max_queue_size=50)
@@ -1,8 +1,6 @@
 import os
-import shutil
 import time
 from concurrent.futures import ThreadPoolExecutor
-from PIL import Image
 import tkinter as tk
 from tkinter import ttk, messagebox
 import cv2
@@ -10,7 +8,7 @@ import rawpy
 import numpy as np
 
 from photodisarm.i18n.localization import localization
-from photodisarm.utils.util import center_window, get_images_rec
+from photodisarm.utils.util import center_window, get_images_rec, move_file
 
 
 class CorruptDetector:
@@ -169,7 +167,7 @@ class CorruptDetector:
                                             dest_path = os.path.join(corrupted_dir, f"{name}_{counter}{ext}")
                                             counter += 1
                                     
-                                    shutil.move(image_path, dest_path)
+                                    move_file(image_path, dest_path)
                                     corrupt_count += 1
                                     print(f"Moved corrupt image: {image_path} -> {dest_path}")
                                 except Exception as e:
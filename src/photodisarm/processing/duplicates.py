@@ -1,6 +1,6 @@
 import hashlib
+import mmap
 import os
-import shutil
 import time
 from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
@@ -8,17 +8,40 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 
 from photodisarm.i18n.localization import localization
-from photodisarm.utils.util import center_window, get_images_rec
+from photodisarm.utils.util import center_window, get_images_rec, move_file
 
 class duplicates:
     def hash_image(image_path):
         try:
+            if image_path.lower().endswith('.nef'):
+                return duplicates.hash_file(image_path)
             with Image.open(image_path) as img:
-                return hashlib.md5(img.tobytes()).hexdigest()
+                # Let libjpeg decode at a reduced DCT scale instead of full resolution;
+                # formats without draft support simply ignore this. The hash stays in
+                # colour so images that only differ in hue aren't taken as duplicates.
+                img.draft("RGB", (64, 64))
+                return hashlib.md5(img.convert("RGB").tobytes()).hexdigest()
         except Exception as e:
             print(f"Error hashing {image_path}: {e}")
             return None
 
+    def hash_file(file_path):
+        """
+        Hash the raw bytes of a file through a read-only memory map.
+        
+        Used for RAW files, which Pillow can't decode; mapping the file lets the
+        hash read straight from the page cache instead of copying 40-80 MB into
+        a bytes object first.
+        
+        Args:
+            file_path: Path to the file
+            
+        Returns:
+            Hex digest of the file contents
+        """
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.md5(mm).hexdigest()
+
     def add_with_progress(image_directory_or_paths, output_dir=None):
         """
         Process images in chunks to detect and move duplicates.
@@ -39,6 +62,8 @@ class duplicates:
         # Ensure the duplicates directory exists within the output directory
         duplicates_dir = os.path.join(output_dir, "duplicates") if output_dir else "duplicates"
         os.makedirs(duplicates_dir, exist_ok=True)
+        # Destination prefix (with trailing separator) so each move is a single concatenation
+        duplicates_prefix = os.path.join(os.path.abspath(duplicates_dir), "")
         
         # Configure the GUI progress bar
         progress_window = tk.Tk()
@@ -101,24 +126,32 @@ class duplicates:
                     
                     image_chunks_generator = list_to_chunks(image_directory_or_paths, 100)
             
-                # Process images chunk by chunk
-                for i, image_chunk in enumerate(image_chunks_generator):
-                    # Update status
-                    status_label.config(text=lang["processing_chunk"].format(chunk_num=i+1))
-                    
-                    # Process the chunk with ThreadPoolExecutor
-                    with ThreadPoolExecutor() as executor:
-                        # Create list of (path, hash) tuples, filtering out None hashes
-                        hash_results = [(path, hash_val) for path, hash_val in 
-                                    zip(image_chunk, executor.map(duplicates.hash_image, image_chunk))
-                                    if hash_val is not None]
-                        
-                        # Process each image
-                        for image_path, md5hash in hash_results:
+                # Share one pool across all chunks and keep the next chunk hashing
+                # while the current one is moved and reported, so file reads overlap
+                # with the duplicate moves and GUI updates
+                with ThreadPoolExecutor() as executor:
+                    chunk_iter = enumerate(image_chunks_generator)
+                    pending = next(chunk_iter, None)
+                    if pending is not None:
+                        pending = (*pending, executor.map(duplicates.hash_image, pending[1]))
+
+                    while pending is not None:
+                        i, image_chunk, hashes = pending
+                        upcoming = next(chunk_iter, None)
+                        if upcoming is not None:
+                            upcoming = (*upcoming, executor.map(duplicates.hash_image, upcoming[1]))
+
+                        # Update status
+                        status_label.config(text=lang["processing_chunk"].format(chunk_num=i+1))
+
+                        # Process each image as its hash becomes available, skipping failed hashes
+                        for image_path, md5hash in zip(image_chunk, hashes):
+                            if md5hash is None:
+                                continue
                             if md5hash in dupSet:
                                 # Move duplicate to duplicates directory
                                 try:
-                                    shutil.move(image_path, os.path.join(duplicates_dir, os.path.basename(image_path)))
+                                    move_file(image_path, duplicates_prefix + os.path.basename(image_path))
                                     total_duplicates += 1
                                 except Exception as e:
                                     print(f"Error moving duplicate {image_path}: {e}")
@@ -141,6 +174,8 @@ class duplicates:
                                 
                                 # Update window to prevent freezing
                                 progress_window.update_idletasks()
+
+                        pending = upcoming
                     
             finally:
                 # Processing complete
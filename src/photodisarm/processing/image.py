@@ -1,30 +1,74 @@
 import cv2
+import io
 import rawpy
 import numpy as np
 import os
-from PIL import Image
-from glob import glob
+from PIL import Image, ExifTags
 from multiprocessing import Pool, cpu_count
 import hashlib
+import logging
 import pickle
 import time
-from photodisarm.ui.canvas import display_message, put_text_utf8, resize_image
+from photodisarm.ui.canvas import resize_image
+from photodisarm.utils.util import ensure_dir
+
+logger = logging.getLogger(__name__)
+
+# Cache directory for processed NEF files
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache')
+
+# cv2 decode flags for JPEG DCT-domain downscaling, largest reduction first
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# Exif orientation -> transform that brings the decoded pixels upright
+EXIF_ORIENTATION_TRANSFORMS = {
+    2: lambda img: cv2.flip(img, 1),
+    3: lambda img: cv2.rotate(img, cv2.ROTATE_180),
+    4: lambda img: cv2.flip(img, 0),
+    5: lambda img: cv2.transpose(img),
+    6: lambda img: cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda img: cv2.flip(cv2.transpose(img), -1),
+    8: lambda img: cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+# LibRaw flip value (raw.sizes.flip) -> transform that brings an embedded preview upright;
+# postprocess() applies this itself, extract_thumb() does not
+RAW_FLIP_TRANSFORMS = {
+    3: lambda img: cv2.rotate(img, cv2.ROTATE_180),
+    5: lambda img: cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE),
+    6: lambda img: cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE),
+}
+
+# Bumped whenever the cached NEF frames change, so stale pickles are not served
+NEF_CACHE_VERSION = 2
+
+_HAS_FADVISE = hasattr(os, "posix_fadvise")
+
+# libjpeg-turbo is optional; without it JPEGs are decoded by OpenCV
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJFLAG_FASTDCT, TJFLAG_FASTUPSAMPLE
+    _TJ = TurboJPEG()
+except (ImportError, RuntimeError, OSError):
+    _TJ = None
+
 
 class Image_processing:
     def __init__(self):
         # Cache directory for processed NEF files
-        self.CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache')
-        os.makedirs(self.CACHE_DIR, exist_ok=True)
+        self.CACHE_DIR = ensure_dir(CACHE_DIR)
 
     @staticmethod
-    def get_cache_path(file_path):
-        """Generate a unique cache path based on file path and modification time"""
-        # Define cache directory as a static path
-        cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache')
-        os.makedirs(cache_dir, exist_ok=True)
+    def get_cache_path(file_path, quality='normal'):
+        """Generate a unique cache path based on file path, modification time and quality"""
+        # Define cache directory as a static path (created once per session)
+        cache_dir = ensure_dir(CACHE_DIR)
         
         file_stat = os.stat(file_path)
-        hash_input = f"{file_path}_{file_stat.st_mtime}"
+        hash_input = f"{file_path}_{file_stat.st_mtime}_{quality}_v{NEF_CACHE_VERSION}"
         file_hash = hashlib.md5(hash_input.encode()).hexdigest()
         return os.path.join(cache_dir, f"{file_hash}.pkl")
 
@@ -45,36 +89,50 @@ class Image_processing:
             # For NEF files, check cache first if enabled
             if path.lower().endswith('.nef'):
                 if use_cache:
-                    cache_path = Image_processing.get_cache_path(path)
-                    if os.path.exists(cache_path):
-                        try:
-                            with open(cache_path, 'rb') as f:
-                                cached_data = pickle.load(f)
-                                return path, cached_data
-                        except Exception as e:
-                            print(f"Cache error for {path}: {e}")
-                            # Continue to process if cache fails
+                    cache_path = Image_processing.get_cache_path(path, quality)
+                    try:
+                        with open(cache_path, 'rb') as f:
+                            cached_data = pickle.load(f)
+                            return path, cached_data
+                    except FileNotFoundError:
+                        pass  # Not cached yet
+                    except Exception as e:
+                        print(f"Cache error for {path}: {e}")
+                        # Continue to process if cache fails
                 
                 # Process the NEF file
                 start_time = time.time()
-                print(f"Processing NEF file: {os.path.basename(path)}")
+                logger.debug("Processing NEF file: %s", path)
                 
                 with rawpy.imread(path) as raw:
-                    # Use different processing options based on quality setting
-                    if quality == 'low':
-                        # Faster processing with lower quality
-                        rgb_image = raw.postprocess(use_camera_wb=True, half_size=True, 
-                                                demosaic_algorithm=rawpy.DemosaicAlgorithm.LINEAR)
-                    elif quality == 'high':
-                        # Higher quality but slower
-                        rgb_image = raw.postprocess(use_camera_wb=True, no_auto_bright=False,
-                                                demosaic_algorithm=rawpy.DemosaicAlgorithm.AHD)
-                    else:  # normal
-                        # Balanced approach
-                        rgb_image = raw.postprocess(use_camera_wb=True)
-                
-                # Convert to BGR (OpenCV format)
-                image = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR)
+                    # The embedded preview is far cheaper than a full demosaic and is
+                    # plenty for display; 'high' quality still demosaics the raw data,
+                    # and so does a preview too small to fill the display
+                    image = None
+                    if quality != 'high':
+                        image = Image_processing._extract_nef_thumbnail(raw, max_width, max_height)
+
+                    if image is None:
+                        # Use different processing options based on quality setting
+                        if quality == 'low':
+                            # Faster processing with lower quality
+                            rgb_image = raw.postprocess(use_camera_wb=True, half_size=True, 
+                                                    demosaic_algorithm=rawpy.DemosaicAlgorithm.LINEAR)
+                        elif quality == 'high':
+                            # Higher quality but slower
+                            rgb_image = raw.postprocess(use_camera_wb=True, no_auto_bright=False,
+                                                    demosaic_algorithm=rawpy.DemosaicAlgorithm.AHD)
+                        else:  # normal
+                            # Balanced approach: a half-size demosaic is ~4x cheaper and
+                            # still has more pixels than the display when the sensor is
+                            # at least twice the target size
+                            sizes = raw.sizes
+                            half_size = sizes.width // 2 >= max_width and sizes.height // 2 >= max_height
+                            rgb_image = raw.postprocess(use_camera_wb=True, half_size=half_size,
+                                                    output_bps=8)
+
+                        # Convert to BGR (OpenCV format)
+                        image = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR)
                 
                 # Save to cache if enabled
                 if use_cache:
@@ -83,13 +141,13 @@ class Image_processing:
                     try:
                         with open(cache_path, 'wb') as f:
                             pickle.dump(resized_image, f)
-                        print(f"Cached NEF processing result: {time.time() - start_time:.2f} seconds")
+                        logger.debug("Cached NEF processing result: %.2f seconds", time.time() - start_time)
                         return path, resized_image
                     except Exception as e:
                         print(f"Failed to cache result for {path}: {e}")
             else:
                 # For non-NEF files, use Unicode-safe image loading
-                image = Image_processing._read_image_unicode_safe(path)
+                image = Image_processing._read_image_unicode_safe(path, max_width, max_height, quality)
                 if image is None:
                     print(f"Could not read image: {path}")
                     return None, None
@@ -102,12 +160,162 @@ class Image_processing:
             return None, None
 
     @staticmethod
-    def _read_image_unicode_safe(path):
+    def _extract_nef_thumbnail(raw, max_width=None, max_height=None):
+        """
+        Decode the embedded preview image of an open raw file.
+        
+        The preview is turned upright using the raw file's orientation, since unlike
+        postprocess() extract_thumb() leaves that to the caller.
+        
+        Args:
+            raw: Open rawpy RawPy object
+            max_width: Display width, used to decode JPEG previews at reduced scale
+            max_height: Display height, used to decode JPEG previews at reduced scale
+            
+        Returns:
+            OpenCV (BGR) image array, or None if no thumbnail exists or it is
+            smaller than the display
+        """
+        try:
+            thumb = raw.extract_thumb()
+        except (rawpy.LibRawNoThumbnailError, rawpy.LibRawUnsupportedThumbnailError):
+            return None
+        except Exception as e:
+            print(f"Thumbnail extraction failed: {e}")
+            return None
+
+        if thumb.format == rawpy.ThumbFormat.JPEG:
+            image = Image_processing._decode_image_data(thumb.data, max_width, max_height)
+        elif thumb.format == rawpy.ThumbFormat.BITMAP:
+            image = cv2.cvtColor(thumb.data, cv2.COLOR_RGB2BGR)
+        else:
+            return None
+        if image is None:
+            return None
+        
+        transform = RAW_FLIP_TRANSFORMS.get(raw.sizes.flip)
+        if transform:
+            image = transform(image)
+        
+        # resize_image never enlarges, so a small preview would be shown small
+        height, width = image.shape[:2]
+        if max_width and max_height and width < max_width and height < max_height:
+            return None
+        return image
+
+    @staticmethod
+    def _jpeg_header(data):
+        """
+        Read the size and Exif orientation of JPEG data without decoding it.
+        
+        Args:
+            data: Encoded image bytes
+            
+        Returns:
+            (width, height, orientation) tuple, or None if the data is not a JPEG
+        """
+        try:
+            # Only the header is parsed here
+            with Image.open(io.BytesIO(data)) as img:
+                if img.format != 'JPEG':
+                    return None
+                width, height = img.size
+                orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+        except Exception:
+            return None
+        return width, height, orientation
+
+    @staticmethod
+    def _reduction_factor(width, height, max_width=None, max_height=None):
+        """
+        Pick the largest JPEG scale-down (8, 4, 2 or 1) that still fills the display.
+        
+        Args:
+            width: Encoded image width
+            height: Encoded image height
+            max_width: Display width (no reduction if None)
+            max_height: Display height (no reduction if None)
+            
+        Returns:
+            Reduction factor
+        """
+        if not max_width or not max_height:
+            return 1
+        # Largest shrink that still fills the display, whichever way Exif rotates the image
+        fit_scale = max(min(max_width / width, max_height / height),
+                        min(max_width / height, max_height / width))
+        for factor, _ in REDUCED_DECODE_FLAGS:
+            if factor * fit_scale <= 1:
+                return factor
+        return 1
+
+    @staticmethod
+    def _reduced_decode_flag(data, max_width=None, max_height=None):
+        """
+        Pick the cheapest OpenCV decode flag that still gives display resolution.
+        
+        For JPEGs, the IMREAD_REDUCED_COLOR_* flags let libjpeg decode at 1/2, 1/4
+        or 1/8 scale straight from the DCT coefficients, which is much faster than
+        decoding every pixel and throwing most of them away in resize_image.
+        
+        Args:
+            data: Encoded image bytes
+            max_width: Display width (no reduction if None)
+            max_height: Display height (no reduction if None)
+            
+        Returns:
+            cv2.IMREAD_* flag to pass to cv2.imdecode
+        """
+        header = Image_processing._jpeg_header(data) if max_width and max_height else None
+        if header is None:
+            return cv2.IMREAD_COLOR
+        factor = Image_processing._reduction_factor(header[0], header[1], max_width, max_height)
+        return dict(REDUCED_DECODE_FLAGS).get(factor, cv2.IMREAD_COLOR)
+
+    @staticmethod
+    def _decode_image_data(data, max_width=None, max_height=None, quality='normal'):
+        """
+        Decode encoded image bytes, using libjpeg-turbo for JPEGs when it is installed.
+        
+        Args:
+            data: Encoded image bytes
+            max_width: Display width; if given, JPEGs are decoded at a reduced scale
+            max_height: Display height; if given, JPEGs are decoded at a reduced scale
+            quality: Image quality - 'high' uses libjpeg-turbo's accurate IDCT and
+                upsampling instead of the fast approximations
+            
+        Returns:
+            OpenCV (BGR) image array or None if the data could not be decoded
+        """
+        if _TJ is not None:
+            header = Image_processing._jpeg_header(data)
+            if header is not None:
+                width, height, orientation = header
+                factor = Image_processing._reduction_factor(width, height, max_width, max_height)
+                try:
+                    image = _TJ.decode(data, pixel_format=TJPF_BGR,
+                                       scaling_factor=(1, factor) if factor > 1 else None,
+                                       flags=0 if quality == 'high' else TJFLAG_FASTDCT | TJFLAG_FASTUPSAMPLE)
+                except Exception as e:
+                    print(f"TurboJPEG decode failed, falling back to OpenCV: {e}")
+                else:
+                    # Unlike cv2.imdecode, TurboJPEG ignores the Exif orientation
+                    transform = EXIF_ORIENTATION_TRANSFORMS.get(orientation)
+                    return transform(image) if transform else image
+        
+        flag = Image_processing._reduced_decode_flag(data, max_width, max_height)
+        return cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+
+    @staticmethod
+    def _read_image_unicode_safe(path, max_width=None, max_height=None, quality='normal'):
         """
         Read an image file in a Unicode-safe way that handles special characters.
         
         Args:
             path: Path to the image file
+            max_width: Display width; if given, JPEGs are decoded at a reduced scale
+            max_height: Display height; if given, JPEGs are decoded at a reduced scale
+            quality: Image quality - 'low', 'normal', or 'high'
             
         Returns:
             OpenCV image array or None if failed
@@ -115,9 +323,11 @@ class Image_processing:
         try:
             # Method 1: Use numpy and cv2.imdecode for Unicode support
             with open(path, 'rb') as f:
-                file_bytes = np.frombuffer(f.read(), np.uint8)
-            image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-            return image
+                if _HAS_FADVISE:
+                    # The whole file is read front to back; let the kernel read ahead further
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                data = f.read()
+            return Image_processing._decode_image_data(data, max_width, max_height, quality)
         except Exception as e:
             print(f"Unicode-safe image reading failed for {path}: {e}")
             try:
@@ -142,14 +352,18 @@ class Image_processing:
         Returns:
             List of (path, image) tuples for successfully processed images
         """
-        if max_workers is None:
-            max_workers = max(1, cpu_count() - 1)  # Leave one CPU free
-        
-        with Pool(processes=max_workers) as pool:
-            # Create a list of argument tuples for each image
-            args = [(path, max_width, max_height, use_cache, quality) for path in image_paths]
-            # Process images in parallel
-            results = pool.starmap(Image_processing.process_image_wrapper, args)
+        if len(image_paths) == 1:
+            # A single image isn't worth the pickling round-trip through the pool
+            results = [Image_processing.process_image(image_paths[0], max_width, max_height, use_cache, quality)]
+        else:
+            if max_workers is None:
+                max_workers = max(1, cpu_count() - 1)  # Leave one CPU free
+            
+            with Pool(processes=max_workers) as pool:
+                # Create a list of argument tuples for each image
+                args = [(path, max_width, max_height, use_cache, quality) for path in image_paths]
+                # Process images in parallel
+                results = pool.starmap(Image_processing.process_image_wrapper, args)
         
         # Filter out failed results
         return [result for result in results if result[1] is not None]
@@ -1,5 +1,6 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
+import logging
 import os
 import traceback
 
@@ -391,6 +392,12 @@ class PhotoDisarmApp:
 
 def main():
     """Main entry point for the application."""
+    # Per-image timing and progress messages are only shown with PHOTODISARM_DEBUG set,
+    # so the viewer doesn't write to the console on every key press
+    logging.basicConfig(
+        level=logging.DEBUG if os.environ.get("PHOTODISARM_DEBUG") else logging.WARNING,
+        format="%(asctime)s %(threadName)s %(name)s: %(message)s"
+    )
     try:
         app = PhotoDisarmApp()
         app.run()
@@ -1,28 +1,27 @@
 import cv2
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
+import functools
 import os
+import threading
+import unicodedata
 
-def put_text_utf8(img, text, position, font_size=30, color=(255, 255, 255), thickness=2, with_background=True):
+# Padding around the semi-transparent text background
+TEXT_BACKGROUND_PADDING = 5
+# Outline offsets used to keep text readable when there is no background
+TEXT_OUTLINE_OFFSETS = ((1, 1), (-1, -1), (1, -1), (-1, 1), (2, 0), (-2, 0), (0, 2), (0, -2))
+
+# FreeType font objects are not safe to render with from several threads at once
+_font_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_font(font_size):
     """
-    Draw text with UTF-8 support (for characters like æ, ø, å) and improved visibility
+    Load a font that supports Danish characters, falling back to PIL's default font.
     
-    Args:
-        img: OpenCV image (numpy array)
-        text: UTF-8 text to display
-        position: (x, y) position for the text
-        font_size: Size of the font
-        color: (B, G, R) color tuple
-        thickness: Text thickness
-        with_background: Whether to add a semi-transparent background behind text
-        
-    Returns:
-        Modified image with text
+    Fonts are looked up on disk once per size and then reused.
     """
-    # Create a PIL Image from the OpenCV image (converting BGR to RGB)
-    pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-    draw = ImageDraw.Draw(pil_img)
-    
     # Try to use a font that supports Danish characters
     try:
         # Try to find a system font that supports Danish characters
@@ -58,68 +57,293 @@ def put_text_utf8(img, text, position, font_size=30, color=(255, 255, 255), thic
         else:
             # Fallback to default font
             font = ImageFont.load_default()
-            font_size = 15  # Default font is smaller
     
     except Exception as e:
         print(f"Error loading font: {e}")
         font = ImageFont.load_default()
-        font_size = 15  # Default font is smaller
     
-    # Get text dimensions to create background
-    text_bbox = draw.textbbox(position, text, font=font)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_height = text_bbox[3] - text_bbox[1]
+    return font
+
+
+@functools.lru_cache(maxsize=None)
+def _glyph(char, font_size):
+    """
+    Rasterize a single character once, for composing texts glyph by glyph.
     
-    # Add semi-transparent background for better readability
+    Args:
+        char: Character to render
+        font_size: Size of the font
+        
+    Returns:
+        (left, top, right, bottom, mask, advance) where the box is relative to the pen
+        position, mask is the glyph's coverage (None for blank glyphs) and advance is
+        how far the pen moves
+    """
+    font = _get_font(font_size)
+    with _font_lock:
+        left, top, right, bottom = font.getbbox(char)
+        advance = font.getlength(char)
+        mask = None
+        if right > left and bottom > top:
+            glyph_image = Image.new('L', (right - left, bottom - top), 0)
+            ImageDraw.Draw(glyph_image).text((-left, -top), char, font=font, fill=255)
+            mask = np.asarray(glyph_image)
+    return left, top, right, bottom, mask, advance
+
+
+def _layout_text(text, font_size):
+    """
+    Place each character of text using the cached glyphs.
+    
+    Most overlay texts differ only in a few digits from frame to frame (like the
+    position counter), so building them from cached glyphs is much cheaper than
+    having PIL shape and render every new string.
+    
+    Returns:
+        ((left, top, right, bottom), placed glyphs as (x, y, mask)), with the same
+        box PIL's getbbox would give
+    """
+    pen = 0.0
+    placed = []
+    left = top = right = bottom = None
+    for char in text:
+        g_left, g_top, g_right, g_bottom, mask, advance = _glyph(char, font_size)
+        x = int(round(pen))
+        if mask is not None:
+            placed.append((x + g_left, g_top, mask))
+        left = x + g_left if left is None else min(left, x + g_left)
+        top = g_top if top is None else min(top, g_top)
+        right = x + g_right if right is None else max(right, x + g_right)
+        bottom = g_bottom if bottom is None else max(bottom, g_bottom)
+        pen += advance
+    if left is None:
+        return (0, 0, 0, 0), placed
+    return (left, top, right, bottom), placed
+
+
+def _can_compose(text):
+    """Whether text can be drawn glyph by glyph (no combining marks or control characters)."""
+    return text.isprintable() and not any(unicodedata.combining(char) for char in text)
+
+
+def text_bbox(text, font_size=30):
+    """
+    Measure text as put_text_utf8 draws it.
+    
+    Args:
+        text: UTF-8 text to measure
+        font_size: Size of the font
+        
+    Returns:
+        (left, top, right, bottom) of the drawn text relative to its position,
+        not counting the background padding
+    """
+    if _can_compose(text):
+        return _layout_text(text, font_size)[0]
+    font = _get_font(font_size)
+    with _font_lock:
+        return font.getbbox(text)
+
+
+@functools.lru_cache(maxsize=256)
+def _text_sprite(text, font_size, with_background):
+    """
+    Rasterize a text overlay once and cache it.
+    
+    The sprite is color independent: it holds coverage masks that are blended
+    with the requested color when the text is drawn.
+    
+    Args:
+        text: UTF-8 text to render
+        font_size: Size of the font
+        with_background: Whether the text gets a background box (otherwise an outline)
+        
+    Returns:
+        (offset_x, offset_y, text_mask, outline_mask, box) where the offsets place the
+        masks relative to the text position, outline_mask is None when there is a
+        background, and box is the background rectangle (x0, y0, x1, y1) relative to
+        the text position or None
+    """
+    compose = _can_compose(text)
+    if compose:
+        (left, top, right, bottom), placed = _layout_text(text, font_size)
+    else:
+        font = _get_font(font_size)
+        left, top, right, bottom = text_bbox(text, font_size)
+    text_width = right - left
+    text_height = bottom - top
+    padding = TEXT_BACKGROUND_PADDING
+    
+    # Area (relative to the text position) that the text and its background or outline cover
+    offset_x = min(-padding, left - 2)
+    offset_y = min(-padding, top - 2)
+    size = (max(text_width + padding, right + 2) + 1 - offset_x,
+            max(text_height + padding, bottom + 2) + 1 - offset_y)
+    origin = (-offset_x, -offset_y)
+    
+    if compose:
+        text_mask = np.zeros((size[1], size[0]), dtype=np.uint8)
+        for x, y, mask in placed:
+            target = text_mask[origin[1] + y:origin[1] + y + mask.shape[0],
+                               origin[0] + x:origin[0] + x + mask.shape[1]]
+            np.maximum(target, mask, out=target)
+    else:
+        text_image = Image.new('L', size, 0)
+        with _font_lock:
+            ImageDraw.Draw(text_image).text(origin, text, font=font, fill=255)
+        text_mask = np.asarray(text_image)
+    
+    outline_mask = None
+    box = None
     if with_background:
-        # Create a new transparent image for the background
-        overlay = Image.new('RGBA', pil_img.size, (0, 0, 0, 0))
-        overlay_draw = ImageDraw.Draw(overlay)
+        box = (-padding, -padding, text_width + padding + 1, text_height + padding + 1)
+    else:
+        # The outline is the text stamped at each offset around it (composited the way
+        # PIL draws overlapping text, so anti-aliased edges accumulate)
+        outline_mask = np.zeros(text_mask.shape, dtype=np.uint16)
+        height, width = text_mask.shape
+        for dx, dy in TEXT_OUTLINE_OFFSETS:
+            target = outline_mask[max(0, dy):height + min(0, dy), max(0, dx):width + min(0, dx)]
+            stamp = text_mask[max(0, -dy):height + min(0, -dy), max(0, -dx):width + min(0, -dx)]
+            target += ((255 - target) * stamp + 127) // 255
+        outline_mask = outline_mask.astype(np.uint8)
+    
+    return offset_x, offset_y, text_mask, outline_mask, box
+
+
+def _blend_mask(region, mask, color):
+    """Blend a solid color into region in place, using mask (0-255) as coverage."""
+    alpha = mask[..., None].astype(np.uint16)
+    region[...] = (region * (255 - alpha) + np.array(color, dtype=np.uint16) * alpha + 127) // 255
+
+
+def text_region(img, text, position, font_size=30, with_background=True):
+    """
+    Get the part of img that put_text_utf8 changes when drawing this text.
+    
+    Args:
+        img: OpenCV image (numpy array)
+        text: UTF-8 text to display
+        position: (x, y) position for the text
+        font_size: Size of the font
+        with_background: Whether the text has a background box
         
-        # Draw a semi-transparent black rectangle behind the text
-        padding = 5  # Padding around text
-        overlay_draw.rectangle(
-            [
-                position[0] - padding,
-                position[1] - padding,
-                position[0] + text_width + padding,
-                position[1] + text_height + padding
-            ],
-            fill=(0, 0, 0, 128)  # Black with 50% opacity
-        )
+    Returns:
+        (row slice, column slice) clipped to the image, or None if the text is
+        entirely outside it
+    """
+    offset_x, offset_y, text_mask, _, _ = _text_sprite(text, font_size, with_background)
+    x0, y0 = position[0] + offset_x, position[1] + offset_y
+    mask_height, mask_width = text_mask.shape
+    img_height, img_width = img.shape[:2]
+    cx0, cy0 = max(0, x0), max(0, y0)
+    cx1, cy1 = min(img_width, x0 + mask_width), min(img_height, y0 + mask_height)
+    if cx0 >= cx1 or cy0 >= cy1:
+        return None
+    return slice(cy0, cy1), slice(cx0, cx1)
+
+
+def put_text_utf8(img, text, position, font_size=30, color=(255, 255, 255), thickness=2, with_background=True):
+    """
+    Draw text with UTF-8 support (for characters like æ, ø, å) and improved visibility
+    
+    The text is drawn into img in place. Each distinct text is rasterized once and
+    cached, so redrawing the same overlay only blends a small cached mask.
+    
+    Args:
+        img: OpenCV image (numpy array), modified in place
+        text: UTF-8 text to display
+        position: (x, y) position for the text
+        font_size: Size of the font
+        color: (B, G, R) color tuple
+        thickness: Text thickness
+        with_background: Whether to add a semi-transparent background behind text
         
-        # Composite the overlay with the original image
-        pil_img = Image.alpha_composite(pil_img.convert('RGBA'), overlay).convert('RGB')
-        draw = ImageDraw.Draw(pil_img)
-    
-    # Draw text with the selected font
-    draw.text(position, text, font=font, fill=(color[2], color[1], color[0]))
-    
-    # Convert back to OpenCV format (RGB to BGR)
-    result_img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-    
-    # Alternative option: Draw text with stroke (border) for better visibility
-    if not with_background:
-        # Drawing with border requires a different approach
-        # First draw text with black outline
-        for offset_x, offset_y in [(1,1), (-1,-1), (1,-1), (-1,1), (2,0), (-2,0), (0,2), (0,-2)]:
-            temp_img = pil_img.copy()
-            temp_draw = ImageDraw.Draw(temp_img)
-            temp_draw.text(
-                (position[0] + offset_x, position[1] + offset_y),
-                text,
-                font=font,
-                fill=(0, 0, 0)  # Black outline
-            )
-            result_img = cv2.cvtColor(np.array(temp_img), cv2.COLOR_RGB2BGR)
+    Returns:
+        The same image, with the text drawn on it
+    """
+    region_slices = text_region(img, text, position, font_size, with_background)
+    if region_slices is None:
+        return img
+    offset_x, offset_y, text_mask, outline_mask, box = _text_sprite(text, font_size, with_background)
+    x, y = position
+    
+    # Add semi-transparent background for better readability
+    if box is not None:
+        # Darken the box behind the text to 50% (same as compositing black at alpha 128)
+        background = img[max(0, y + box[1]):max(0, y + box[3]), max(0, x + box[0]):max(0, x + box[2])]
+        background[...] = background.astype(np.uint16) * 127 // 255
+    
+    # The sprite, clipped to the image
+    x0, y0 = x + offset_x, y + offset_y
+    rows, cols = region_slices
+    region = img[region_slices]
+    mask_slice = (slice(rows.start - y0, rows.stop - y0), slice(cols.start - x0, cols.stop - x0))
+    
+    if outline_mask is not None:
+        _blend_mask(region, outline_mask[mask_slice], (0, 0, 0))
+    _blend_mask(region, text_mask[mask_slice], color)
+    
+    return img
+
+
+def put_text_utf8_multi(img, items, saved=None):
+    """
+    Draw several text overlays onto the same image in one call.
+    
+    Args:
+        img: OpenCV image (numpy array), modified in place
+        items: Iterable of (text, position, font_size, color, with_background) tuples;
+            empty texts are skipped
+        saved: Optional list that receives the original pixels under each overlay,
+            so restore_regions can undo the drawing
         
-        # Then draw main text in original color
-        final_img = Image.fromarray(cv2.cvtColor(result_img, cv2.COLOR_BGR2RGB))
-        final_draw = ImageDraw.Draw(final_img)
-        final_draw.text(position, text, font=font, fill=(color[2], color[1], color[0]))
-        result_img = cv2.cvtColor(np.array(final_img), cv2.COLOR_RGB2BGR)
+    Returns:
+        The same image, with all the texts drawn on it
+    """
+    for text, position, font_size, color, with_background in items:
+        if not text:
+            continue
+        if saved is not None:
+            region_slices = text_region(img, text, position, font_size, with_background)
+            if region_slices is None:
+                continue
+            saved.append((region_slices, img[region_slices].copy()))
+        put_text_utf8(img, text, position, font_size=font_size, color=color,
+                      with_background=with_background)
+    return img
+
+
+def restore_regions(img, saved):
+    """Put back the pixels saved by put_text_utf8_multi, undoing its overlays."""
+    for region_slices, original in reversed(saved):
+        img[region_slices] = original
+
+
+def draw_date_overlay(img, date_info, max_width, max_height):
+    """
+    Draw the image date in the bottom right corner of a display-sized frame.
     
-    return result_img
+    Args:
+        img: OpenCV image (numpy array) of size max_width x max_height
+        date_info: Date text to display
+        max_width: Width of the display frame
+        max_height: Height of the display frame
+        
+    Returns:
+        Image with the date overlay
+    """
+    # Right-align the text 20px from the edge using its measured width
+    right = text_bbox(date_info, 18)[2]
+    return put_text_utf8(
+        img,
+        date_info,
+        position=(max_width - right - 20, max_height - 30),
+        font_size=18,
+        color=(255, 255, 255),
+        thickness=2,
+        with_background=True  # Add semi-transparent background
+    )
 
 
 def display_message(message, width, height):
@@ -150,17 +374,19 @@ def resize_image(image, max_width, max_height):
         new_width = int(w * scale_factor)
         new_height = int(h * scale_factor)
 
-    # Resize the image to the new dimensions
-    resized_image = cv2.resize(image, (new_width, new_height))
-
     # Create a blank canvas with max dimensions
     canvas = np.zeros((max_height, max_width, 3), dtype=np.uint8)
 
     # Calculate center position
     y_offset = (max_height - new_height) // 2
     x_offset = (max_width - new_width) // 2
+    target = canvas[y_offset:y_offset + new_height, x_offset:x_offset + new_width]
 
-    # Place the resized image on the canvas, if it fits
-    canvas[y_offset:y_offset + new_height, x_offset:x_offset + new_width] = resized_image
+    # Resize straight into the canvas; INTER_AREA is both faster and sharper than
+    # the default bilinear filter when shrinking
+    resized_image = cv2.resize(image, (new_width, new_height), dst=target, interpolation=cv2.INTER_AREA)
+    if not np.may_share_memory(resized_image, canvas):
+        # Older OpenCV builds may not write into a strided view
+        target[...] = resized_image
 
     return canvas
\ No newline at end of file
@@ -1,80 +1,161 @@
+import errno
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
 import os
 from PIL import Image, ExifTags
 from datetime import datetime
 import shutil
+import threading
 import tkinter as tk
 import cv2
-from pathlib import Path
 
+logger = logging.getLogger(__name__)
 
-# If you want an even more memory-efficient approach using generators:
-def get_images(directory, chunk_size=25, valid_exts=(".jpg", ".jpeg", ".png", ".bmp", ".nef")):
+
+# Default image extensions (lowercase, without the leading dot)
+VALID_EXTS = frozenset(("jpg", "jpeg", "png", "bmp", "nef"))
+
+
+def _normalize_exts(valid_exts):
+    """Turn an iterable of extensions like '.JPG' into a lowercase frozenset without dots."""
+    if valid_exts is VALID_EXTS:
+        return VALID_EXTS
+    return frozenset(ext.lower().lstrip(".") for ext in valid_exts)
+
+
+def _scan_images(directory, exts, recursive):
     """
-    Get images from a directory in chunks to balance memory usage and processing efficiency.
+    Walk a directory with os.scandir, yielding a DirEntry for every image file.
     
     Args:
         directory: Directory to search
-        chunk_size: Number of image paths to yield at once
-        valid_exts: Tuple of valid file extensions to include
+        exts: Frozenset of lowercase extensions without the leading dot
+        recursive: Whether to descend into subdirectories
         
     Returns:
-        Generator yielding chunks of image paths
+        Generator yielding os.DirEntry objects
     """
-    directory_path = Path(directory)
+    pending_dirs = [directory]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        if os.path.splitext(entry.name)[1][1:].lower() in exts:
+                            yield entry
+                    elif recursive and entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+        except OSError as e:
+            print(f"Could not scan {current_dir}: {e}")
+
+
+def _chunked_image_paths(directory, chunk_size, valid_exts, recursive):
+    """Group the paths found by _scan_images into lists of chunk_size."""
     chunk = []
     
-    for ext in valid_exts:
-        for path in directory_path.glob(f"*{ext}"):
-            chunk.append(str(path))
-            if len(chunk) >= chunk_size:
-                yield chunk
-                chunk = []
+    for entry in _scan_images(directory, _normalize_exts(valid_exts), recursive):
+        chunk.append(entry.path)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
     
     # Yield any remaining images
     if chunk:
         yield chunk
 
-def get_images_rec(directory, chunk_size=25, valid_exts=(".jpg", ".jpeg", ".png", ".bmp", ".nef")):
+
+def list_image_stats(directory, recursive=False, valid_exts=VALID_EXTS):
+    """
+    Get all image paths in a directory with their stat results, in a single scandir pass.
+    
+    os.scandir already has the size and modification time on Windows, and on other
+    platforms DirEntry.stat() caches the result, so later code (like the date sort)
+    doesn't need to stat the files again.
+    
+    Args:
+        directory: Directory to search
+        recursive: Whether to include subdirectories
+        valid_exts: Iterable of valid file extensions to include (case-insensitive)
+        
+    Returns:
+        Dict mapping image path -> os.stat_result, in scan order
+    """
+    stats = {}
+    for entry in _scan_images(directory, _normalize_exts(valid_exts), recursive):
+        try:
+            stats[entry.path] = entry.stat()
+        except OSError as e:
+            print(f"Could not stat {entry.path}: {e}")
+    return stats
+
+
+# If you want an even more memory-efficient approach using generators:
+def get_images(directory, chunk_size=25, valid_exts=VALID_EXTS):
+    """
+    Get images from a directory in chunks to balance memory usage and processing efficiency.
+    
+    Args:
+        directory: Directory to search
+        chunk_size: Number of image paths to yield at once
+        valid_exts: Iterable of valid file extensions to include (case-insensitive)
+        
+    Returns:
+        Generator yielding chunks of image paths
+    """
+    return _chunked_image_paths(directory, chunk_size, valid_exts, recursive=False)
+
+def get_images_rec(directory, chunk_size=25, valid_exts=VALID_EXTS):
     """
     Recursively get all image files from a directory and its subdirectories in chunks.
     
     Args:
         directory: Root directory to search
         chunk_size: Number of image paths to yield at once
-        valid_exts: Tuple of valid file extensions to include
+        valid_exts: Iterable of valid file extensions to include (case-insensitive)
         
     Returns:
         Generator yielding chunks of image paths from recursive search
     """
-    directory_path = Path(directory)
-    chunk = []
-    
-    for ext in valid_exts:
-        for path in directory_path.rglob(f"*{ext}"):
-            chunk.append(str(path))
-            if len(chunk) >= chunk_size:
-                yield chunk
-                chunk = []
-    
-    # Yield any remaining images
-    if chunk:
-        yield chunk
+    return _chunked_image_paths(directory, chunk_size, valid_exts, recursive=True)
+
+EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+UNIX_EPOCH = datetime(1970, 1, 1)
+
 
 def get_image_metadata_date(image_path):
-    # Open the image file
-    with open(image_path, "rb") as file:
-        image = Image.open(file)
-        print(image)
+    # Open the image file (only the header is parsed, pixel data is not decoded)
+    with Image.open(image_path) as image:
         # Get the image's Exif data
         exif_data = image.getexif()
-        print(exif_data)
-        if exif_data is not None:
-            # Get only DateTimeOriginal tag from the Exif data
-            for tag_id, value in exif_data.items():
-                tag = ExifTags.TAGS.get(tag_id, tag_id)
-                if tag == "DateTimeOriginal" or tag == "DateTime":
-                    return value
-    return None
+        if exif_data is None:
+            return None
+        # The capture time lives in the Exif sub-IFD; IFD0's DateTime is when the file
+        # was last changed by software, so it is only the fallback
+        value = exif_data.get_ifd(ExifTags.IFD.Exif).get(ExifTags.Base.DateTimeOriginal)
+        if not value:
+            value = exif_data.get(ExifTags.Base.DateTime)
+    return value or None
+
+
+def parse_image_date(date_str):
+    """
+    Parse an Exif date string into a datetime.
+    
+    Args:
+        date_str: Date string as returned by get_image_metadata_date
+        
+    Returns:
+        datetime object, or None if the string is missing or malformed
+    """
+    if not date_str:
+        return None
+    try:
+        return datetime.strptime(date_str, EXIF_DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None
                 
 
 def printDateOnWindow(image):
@@ -87,59 +168,383 @@ def printDateOnWindow(image):
     cv2.rectangle(image, (text_x - 5, text_y - text_height - baseline), (text_x + text_width + 5, text_y + 5), (255, 255, 255), -1)
     cv2.putText(image, f"{date}", (text_x, text_y), cv2.FONT_ITALIC, 0.8, (0, 0, 0), 2)
 
-# Returns a list of image paths sorted by their creation date
-def sort_images_by_date(image_paths: list):
-    return sorted(image_paths, key=lambda x: os.path.getctime(x))
+# Exif capture dates used for sorting and for the date overlay, persisted between runs
+# so unchanged files never need their Exif re-read.
+# Maps path -> [st_mtime_ns, st_size, timestamp or None, date string or None]
+DATE_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'date_index.json')
+_date_index = None
+# Whether _date_index has changes that aren't on disk yet
+_date_index_dirty = False
+# Held while the index is loaded, changed or saved (the viewer updates it from a background thread)
+_date_index_lock = threading.Lock()
 
 
-def move_image_to_dir_with_date(image_path, output_dir=None) -> str:
+def _load_date_index():
+    """Load the persisted date index on first use."""
+    global _date_index
+    with _date_index_lock:
+        if _date_index is None:
+            try:
+                with open(DATE_INDEX_PATH, 'r', encoding='utf-8') as f:
+                    _date_index = json.load(f)
+            except (OSError, ValueError):
+                _date_index = {}
+        return _date_index
+
+
+def save_date_index():
     """
-    Move an image to a directory structure organized by date.
-    If the folders already exist, they will be used as is.
+    Write the date index back to disk (atomically, via a temp file) if it changed.
+    
+    The index covers the whole library, so it is written once per session rather
+    than every time a chunk adds entries.
+    """
+    global _date_index_dirty
+    with _date_index_lock:
+        if not _date_index_dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(DATE_INDEX_PATH), exist_ok=True)
+            tmp_path = DATE_INDEX_PATH + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(_date_index, f)
+            os.replace(tmp_path, DATE_INDEX_PATH)
+            _date_index_dirty = False
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not save date index: {e}")
+
+
+def prune_date_index(directory, image_paths, recursive=False):
+    """
+    Drop index entries for images that are no longer in a scanned directory.
+    
+    Moved and deleted files would otherwise stay in the index forever. Entries
+    outside the scanned directory (or in subdirectories of a non-recursive scan)
+    are left alone, since they belong to other folders.
+    
+    Args:
+        directory: Directory that was scanned
+        image_paths: Image paths the scan found
+        recursive: Whether the scan included subdirectories
+    """
+    global _date_index_dirty
+    index = _load_date_index()
+    directory = os.path.normpath(directory)
+    prefix = os.path.join(directory, '')
+    found = set(image_paths)
+    with _date_index_lock:
+        gone = [path for path in index
+                if path not in found and path.startswith(prefix)
+                and (recursive or os.path.dirname(os.path.normpath(path)) == directory)]
+        for path in gone:
+            del index[path]
+        if gone:
+            _date_index_dirty = True
+
+
+def _index_entry(image_path, stat_result):
+    """Build a date index entry by reading the file's Exif capture date."""
+    try:
+        date_str = get_image_metadata_date(image_path)
+    except Exception:
+        date_str = None
+    # Only strings are kept, so every entry can be written to JSON
+    if isinstance(date_str, bytes):
+        date_str = date_str.decode('ascii', errors='ignore')
+    if not isinstance(date_str, str):
+        date_str = None
+    date = parse_image_date(date_str)
+    # Seconds since 1970 computed without the local time zone: datetime.timestamp()
+    # raises OSError on Windows for naive dates before 1970
+    timestamp = (date - UNIX_EPOCH).total_seconds() if date else None
+    return [stat_result.st_mtime_ns, stat_result.st_size, timestamp, date_str]
+
+
+def _local_mtime_seconds(stat_result):
+    """
+    Get a file's modification time on the same scale as the index timestamps.
+    
+    Exif dates are local wall-clock times without a time zone, so the mtime is
+    converted to local time too; otherwise the two are off by the UTC offset.
+    """
+    try:
+        return (datetime.fromtimestamp(stat_result.st_mtime) - UNIX_EPOCH).total_seconds()
+    except (OSError, OverflowError, ValueError):
+        return stat_result.st_mtime
+
+
+def _current_entry(index, path, stat_result):
+    """Return the indexed entry for path if it is still valid for the file, else None."""
+    entry = index.get(path)
+    if (entry is None or len(entry) < 4
+            or entry[0] != stat_result.st_mtime_ns or entry[1] != stat_result.st_size):
+        return None
+    return entry
+
+
+def get_image_date(image_path):
+    """
+    Get an image's Exif date string, answered from the date index when possible.
+    
+    Images that went through sort_images_by_date are looked up with a single stat
+    instead of reopening the file to parse its Exif again. Other images have their
+    Exif read once and kept in the in-memory index, so the date overlay and the
+    save destination don't both parse it.
+    
+    Args:
+        image_path: Path to the image file
+        
+    Returns:
+        Exif date string, or None if the image has no date
+    """
+    global _date_index_dirty
+    index = _load_date_index()
+    stat_result = os.stat(image_path)
+    entry = _current_entry(index, image_path, stat_result)
+    if entry is None:
+        entry = _index_entry(image_path, stat_result)
+        # Written to disk with the next save_date_index
+        with _date_index_lock:
+            index[image_path] = entry
+            _date_index_dirty = True
+    return entry[3]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_exif_executor():
+    """Thread pool for Exif reads, created on first use and shared by every chunk."""
+    return ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4), thread_name_prefix="exif")
+
+
+def _refresh_date_index(image_paths, stats):
+    """
+    Read Exif dates for the images that are missing from the index or changed.
+    
+    The Exif reads are dominated by file I/O, so they run on a thread pool.
+    
+    Args:
+        image_paths: List of image paths
+        stats: os.stat results matching image_paths
+        
+    Returns:
+        The date index
+    """
+    global _date_index_dirty
+    index = _load_date_index()
+    stale = [(path, stat_result) for path, stat_result in zip(image_paths, stats)
+             if _current_entry(index, path, stat_result) is None]
+    if not stale:
+        return index
+    
+    if len(stale) > 1:
+        entries = list(_get_exif_executor().map(lambda item: _index_entry(*item), stale))
+    else:
+        entries = [_index_entry(*stale[0])]
+    with _date_index_lock:
+        for (path, _), entry in zip(stale, entries):
+            index[path] = entry
+        _date_index_dirty = True
+    return index
+
+
+def prefetch_image_dates(image_paths, known_stats=None):
+    """
+    Make sure the date index covers the given images, without sorting them.
+    
+    Meant to run in the background ahead of sort_images_by_date, so the Exif
+    reads happen while the user is still busy with other images.
+    
+    Args:
+        image_paths: List of image paths
+        known_stats: Optional dict of path -> os.stat_result, e.g. from list_image_stats
+    """
+    known_stats = known_stats or {}
+    paths = []
+    stats = []
+    for path in image_paths:
+        try:
+            stats.append(known_stats.get(path) or os.stat(path))
+        except OSError:
+            continue  # Gone or unreadable; the sort will report it
+        paths.append(path)
+    _refresh_date_index(paths, stats)
+
+
+# Returns a list of image paths sorted by their capture date
+def sort_images_by_date(image_paths: list, known_stats=None):
+    """
+    Sort images by Exif capture date, falling back to modification time.
+    
+    Each file is stat'ed once (or not at all if its stat result is passed in);
+    Exif is only read for files that are new or changed (size/mtime) since they
+    were last indexed, and those reads run in parallel.
+    
+    Args:
+        image_paths: List of image paths
+        known_stats: Optional dict of path -> os.stat_result, e.g. from list_image_stats
+        
+    Returns:
+        New list of image paths, oldest first
+    """
+    known_stats = known_stats or {}
+    stats = [known_stats.get(path) or os.stat(path) for path in image_paths]
+    index = _refresh_date_index(image_paths, stats)
+    
+    keyed = []
+    for path, stat_result in zip(image_paths, stats):
+        entry = index[path]
+        timestamp = entry[2] if entry[2] is not None else _local_mtime_seconds(stat_result)
+        keyed.append((timestamp, path))
+    keyed.sort()
+    return [path for _, path in keyed]
+
+
+@functools.lru_cache(maxsize=None)
+def ensure_dir(path):
+    """
+    Create a directory (and parents) if it doesn't exist.
+    
+    Results are memoized, so each directory is only touched on the filesystem once.
+    
+    Args:
+        path: Directory path
+        
+    Returns:
+        The directory path
+    """
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# Names known to exist in each destination directory, so picking a free file name
+# doesn't stat every numbered candidate. Names are added as destinations are handed out.
+_taken_names = {}
+_taken_names_lock = threading.Lock()
+
+
+def get_free_path(directory, filename, reserved=()):
+    """
+    Get a path in directory for filename that won't overwrite an existing file.
+    
+    If the name is taken, _1, _2, ... is appended before the extension. The
+    directory is listed once per session and kept up to date by move_file;
+    after that only the chosen candidate is checked on disk, in case the file
+    was created by something else.
+    
+    Args:
+        directory: Destination directory
+        filename: Desired file name
+        reserved: Destination paths already promised to moves that haven't happened yet
+        
+    Returns:
+        Free destination path
+    """
+    key = os.path.abspath(directory)
+    with _taken_names_lock:
+        taken = _taken_names.get(key)
+        if taken is None:
+            try:
+                with os.scandir(directory) as entries:
+                    taken = {entry.name for entry in entries}
+            except OSError:
+                taken = set()
+            _taken_names[key] = taken
+        
+        base, ext = os.path.splitext(filename)
+        candidate = filename
+        counter = 1
+        while True:
+            path = os.path.join(directory, candidate)
+            if candidate not in taken and path not in reserved:
+                if not os.path.exists(path):
+                    break
+                taken.add(candidate)  # Created outside this session
+            candidate = f"{base}_{counter}{ext}"
+            counter += 1
+        taken.add(candidate)
+    
+    if candidate != filename:
+        logger.debug("Destination file exists, using %s instead", path)
+    return path
+
+
+def move_file(src, dst):
+    """
+    Move a file, using a single rename when source and destination share a filesystem.
+    
+    Args:
+        src: Path of the file to move
+        dst: Destination file path
+        
+    Returns:
+        The destination path
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Different filesystem, fall back to copy + delete
+        shutil.move(src, dst)
+    
+    # The name is free again in the source directory (e.g. an undone delete)
+    with _taken_names_lock:
+        taken = _taken_names.get(os.path.dirname(os.path.abspath(src)))
+        if taken is not None:
+            taken.discard(os.path.basename(src))
+    return dst
+
+
+def get_date_dir_destination(image_path, output_dir=None, reserved=()) -> str:
+    """
+    Work out where an image goes in the date-organized directory structure.
+    The date folder is created if needed, but the image is not moved.
     
     Args:
         image_path: Path to the image file
         output_dir: Optional output directory (base path)
+        reserved: Destination paths already promised to moves that haven't happened yet
         
     Returns:
-        New path of the moved image file
+        Free destination path for the image
     """
     # Determine the base directory (either provided output_dir or original image directory)
     base_dir = output_dir if output_dir else os.path.dirname(image_path)
     
-    # Get the image's date
-    image_date = get_image_metadata_date(image_path)
+    # Read and parse the image's date once
+    date = parse_image_date(get_image_date(image_path))
     
-    if image_date is None:
-        # If no date found, place in "No Date" folder
+    if date is None:
+        # If no (valid) date found, place in "No Date" folder
         new_dir = os.path.join(base_dir, "No Date")
     else:
-        # Parse the date and create directory structure: year/month
-        date = datetime.strptime(image_date, "%Y:%m:%d %H:%M:%S")
+        # Create directory structure: year/month
         new_dir = os.path.join(base_dir, date.strftime("%Y"), date.strftime("%b"))
     
-    # Check if directory exists, create it if it doesn't
-    if not os.path.exists(new_dir):
-        print(f"Creating directory: {new_dir}")
-        os.makedirs(new_dir, exist_ok=True)
-    else:
-        print(f"Using existing directory: {new_dir}")
+    # Create the directory if needed (only checked once per session)
+    ensure_dir(new_dir)
     
-    # Get the destination file path
-    new_file_path = os.path.join(new_dir, os.path.basename(image_path))
+    # Get a destination file path that doesn't exist (and isn't about to)
+    return get_free_path(new_dir, os.path.basename(image_path), reserved)
+
+
+def move_image_to_dir_with_date(image_path, output_dir=None) -> str:
+    """
+    Move an image to a directory structure organized by date.
+    If the folders already exist, they will be used as is.
     
-    # Check if destination file already exists
-    if os.path.exists(new_file_path):
-        base, ext = os.path.splitext(os.path.basename(image_path))
-        counter = 1
-        while os.path.exists(new_file_path):
-            new_file_path = os.path.join(new_dir, f"{base}_{counter}{ext}")
-            counter += 1
-        print(f"Destination file exists, using {new_file_path} instead")
+    Args:
+        image_path: Path to the image file
+        output_dir: Optional output directory (base path)
+        
+    Returns:
+        New path of the moved image file
+    """
+    new_file_path = get_date_dir_destination(image_path, output_dir)
 
     # Move the file
-    print(f"Moving image from {image_path} to {new_file_path}")
-    shutil.move(image_path, new_file_path)
+    logger.debug("Moving image from %s to %s", image_path, new_file_path)
+    move_file(image_path, new_file_path)
     
     # Return the new full path
     return new_file_path
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from photodisarm.processing.background import BackgroundProcessor, FileMover  # noqa: E402
+
+
+class FileMoverTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, "a.jpg")
+        open(self.src, "wb").close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_moves_in_the_background(self):
+        mover = FileMover()
+        dst = os.path.join(self.tmp.name, "b.jpg")
+        mover.move(self.src, dst)
+        mover.wait()
+        self.assertTrue(os.path.exists(dst))
+        self.assertFalse(os.path.exists(self.src))
+        self.assertEqual(mover.pending_destinations(), set())
+        self.assertEqual(mover.resolve(dst), dst)
+
+    def test_resolve_returns_the_source_after_a_failed_move(self):
+        mover = FileMover()
+        dst = os.path.join(self.tmp.name, "missing", "b.jpg")  # Directory doesn't exist
+        mover.move(self.src, dst)
+        mover.wait()
+        self.assertTrue(os.path.exists(self.src))
+        self.assertEqual(mover.resolve(dst), self.src)
+        # The failure is reported once
+        self.assertEqual(mover.resolve(dst), dst)
+
+
+class BackgroundProcessorRenameTest(unittest.TestCase):
+    def test_rename_rekeys_cached_frame(self):
+        processor = BackgroundProcessor()
+        frame = np.zeros((4, 4, 3), np.uint8)
+        processor.current_chunk = ["in/a.jpg", "in/b.jpg"]
+        processor.processed_images = {"in/a.jpg": frame}
+        processor.rename("in/a.jpg", "out/a.jpg")
+        self.assertEqual(processor.current_chunk, ["out/a.jpg", "in/b.jpg"])
+        self.assertNotIn("in/a.jpg", processor.processed_images)
+        path, image = processor.get_image("out/a.jpg")
+        self.assertEqual(path, "out/a.jpg")
+        self.assertIs(image, frame)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from photodisarm.ui.canvas import put_text_utf8_multi, restore_regions  # noqa: E402
+
+
+class OverlayRoundTripTest(unittest.TestCase):
+    def test_restore_regions_undoes_overlays(self):
+        rng = np.random.default_rng(0)
+        frame = rng.integers(0, 256, (300, 400, 3), dtype=np.uint8)
+        original = frame.copy()
+        saved = []
+        put_text_utf8_multi(frame, (
+            ("Gem | Slet", (10, 10), 18, (255, 255, 255), True),
+            ("", (10, 50), 18, (255, 255, 255), False),
+            ("Æble 3/25", (100, 120), 24, (0, 255, 0), False),
+            # Overlaps the first overlay
+            ("Overlap", (40, 15), 18, (0, 0, 255), True),
+            # Runs off the right edge
+            ("Clipped text", (350, 200), 18, (0, 0, 255), True),
+        ), saved)
+        self.assertFalse(np.array_equal(frame, original))
+        restore_regions(frame, saved)
+        self.assertTrue(np.array_equal(frame, original))
+
+
+if __name__ == "__main__":
+    unittest.main()
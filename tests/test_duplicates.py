@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from photodisarm.processing.duplicates import duplicates  # noqa: E402
+
+
+class HashImageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _save(self, name, color):
+        path = os.path.join(self.tmp.name, name)
+        Image.new("RGB", (32, 32), color).save(path)
+        return path
+
+    def test_identical_images_match(self):
+        self.assertEqual(duplicates.hash_image(self._save("a.png", (200, 30, 30))),
+                         duplicates.hash_image(self._save("b.png", (200, 30, 30))))
+
+    def test_same_brightness_different_colour_differs(self):
+        # Pure red and this grey have the same luminance
+        red = self._save("red.png", (255, 0, 0))
+        grey = self._save("grey.png", (76, 76, 76))
+        with Image.open(red) as red_img, Image.open(grey) as grey_img:
+            self.assertEqual(red_img.convert("L").tobytes(), grey_img.convert("L").tobytes())
+        self.assertNotEqual(duplicates.hash_image(red), duplicates.hash_image(grey))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+import rawpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from photodisarm.processing.image import Image_processing  # noqa: E402
+
+
+def _fake_raw(width, height, flip=0):
+    """Stand-in for an open rawpy file with an RGB bitmap preview of the given size."""
+    thumb = SimpleNamespace(format=rawpy.ThumbFormat.BITMAP, data=np.zeros((height, width, 3), np.uint8))
+    return SimpleNamespace(extract_thumb=lambda: thumb, sizes=SimpleNamespace(flip=flip))
+
+
+class ExtractNefThumbnailTest(unittest.TestCase):
+    def test_landscape_preview_is_kept(self):
+        image = Image_processing._extract_nef_thumbnail(_fake_raw(600, 400), 300, 300)
+        self.assertEqual(image.shape[:2], (400, 600))
+
+    def test_portrait_preview_is_rotated(self):
+        for flip in (5, 6):
+            image = Image_processing._extract_nef_thumbnail(_fake_raw(600, 400, flip), 300, 300)
+            self.assertEqual(image.shape[:2], (600, 400))
+
+    def test_clockwise_flip_moves_top_left_to_top_right(self):
+        raw = _fake_raw(600, 400, flip=6)
+        raw.extract_thumb().data[0, 0] = 255
+        image = Image_processing._extract_nef_thumbnail(raw, 300, 300)
+        self.assertEqual(image[0, -1].tolist(), [255, 255, 255])
+
+    def test_preview_smaller_than_display_is_rejected(self):
+        self.assertIsNone(Image_processing._extract_nef_thumbnail(_fake_raw(160, 120), 800, 600))
+
+
+class ReductionFactorTest(unittest.TestCase):
+    def test_landscape_source(self):
+        # 6000x4000 into 1000x800: 1/4 scale (1500x1000) still fills it, 1/8 doesn't
+        self.assertEqual(Image_processing._reduction_factor(6000, 4000, 1000, 800), 4)
+
+    def test_portrait_source(self):
+        # Rotated upright, 4000x6000 still has to fill 1000x800 at 1/4 scale
+        self.assertEqual(Image_processing._reduction_factor(4000, 6000, 1000, 800), 4)
+
+    def test_small_source_is_not_reduced(self):
+        self.assertEqual(Image_processing._reduction_factor(1200, 900, 1000, 800), 1)
+
+    def test_no_display_size(self):
+        self.assertEqual(Image_processing._reduction_factor(6000, 4000), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
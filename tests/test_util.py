@@ -0,0 +1,148 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from PIL import Image, ExifTags
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from photodisarm.utils import util  # noqa: E402
+from photodisarm.utils.util import get_image_metadata_date, get_images, _index_entry, get_free_path, move_file  # noqa: E402
+
+
+def _save_jpeg(path, date_time=None, date_time_original=None):
+    """Write a small JPEG with the given IFD0 DateTime and Exif sub-IFD DateTimeOriginal."""
+    exif = Image.Exif()
+    if date_time:
+        exif[ExifTags.Base.DateTime] = date_time
+    if date_time_original:
+        exif.get_ifd(ExifTags.IFD.Exif)[ExifTags.Base.DateTimeOriginal] = date_time_original
+    Image.new("RGB", (8, 8)).save(path, exif=exif)
+
+
+class GetImageMetadataDateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "image.jpg")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_prefers_capture_time_from_exif_sub_ifd(self):
+        _save_jpeg(self.path, date_time="2020:01:01 00:00:00", date_time_original="2019:06:15 12:30:00")
+        self.assertEqual(get_image_metadata_date(self.path), "2019:06:15 12:30:00")
+
+    def test_falls_back_to_ifd0_date_time(self):
+        _save_jpeg(self.path, date_time="2020:01:01 00:00:00")
+        self.assertEqual(get_image_metadata_date(self.path), "2020:01:01 00:00:00")
+
+    def test_no_date(self):
+        _save_jpeg(self.path)
+        self.assertIsNone(get_image_metadata_date(self.path))
+
+
+class IndexEntryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "image.jpg")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_pre_1970_date_gets_a_timestamp(self):
+        _save_jpeg(self.path, date_time_original="1965:03:02 10:00:00")
+        entry = _index_entry(self.path, os.stat(self.path))
+        self.assertEqual(entry[3], "1965:03:02 10:00:00")
+        self.assertLess(entry[2], 0)
+
+    def test_entry_without_date(self):
+        _save_jpeg(self.path)
+        self.assertEqual(_index_entry(self.path, os.stat(self.path))[2:], [None, None])
+
+
+class DateIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.multiple(util, DATE_INDEX_PATH=os.path.join(self.tmp.name, "date_index.json"),
+                                      _date_index=None, _date_index_dirty=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @unittest.skipUnless(hasattr(time, "tzset"), "needs time.tzset")
+    def test_exif_and_mtime_dates_sort_on_the_same_clock(self):
+        patcher = mock.patch.dict(os.environ, {"TZ": "Etc/GMT-5"})
+        patcher.start()
+        self.addCleanup(time.tzset)
+        self.addCleanup(patcher.stop)
+        time.tzset()
+        exif_path = os.path.join(self.tmp.name, "exif.jpg")
+        plain_path = os.path.join(self.tmp.name, "plain.jpg")
+        _save_jpeg(exif_path, date_time_original="2020:01:01 12:00:00")
+        _save_jpeg(plain_path)
+        # No Exif, modified an hour after the other image was taken (local time)
+        mtime = datetime(2020, 1, 1, 13, 0).timestamp()
+        os.utime(plain_path, (mtime, mtime))
+        self.assertEqual(util.sort_images_by_date([plain_path, exif_path]), [exif_path, plain_path])
+
+    def test_sorting_does_not_write_until_saved(self):
+        path = os.path.join(self.tmp.name, "image.jpg")
+        _save_jpeg(path, date_time_original="2019:06:15 12:30:00")
+        util.sort_images_by_date([path])
+        self.assertFalse(os.path.exists(util.DATE_INDEX_PATH))
+        util.save_date_index()
+        self.assertTrue(os.path.exists(util.DATE_INDEX_PATH))
+
+    def test_prune_drops_only_missing_images_in_the_scanned_directory(self):
+        scanned = os.path.join(self.tmp.name, "photos")
+        index = util._load_date_index()
+        for name in ("kept.jpg", "gone.jpg", os.path.join("sub", "other.jpg")):
+            index[os.path.join(scanned, name)] = [0, 0, None, None]
+        index[os.path.join(self.tmp.name, "elsewhere.jpg")] = [0, 0, None, None]
+        util.prune_date_index(scanned, [os.path.join(scanned, "kept.jpg")])
+        self.assertEqual(sorted(index), sorted([os.path.join(scanned, "kept.jpg"),
+                                                os.path.join(scanned, "sub", "other.jpg"),
+                                                os.path.join(self.tmp.name, "elsewhere.jpg")]))
+        util.prune_date_index(scanned, [os.path.join(scanned, "kept.jpg")], recursive=True)
+        self.assertNotIn(os.path.join(scanned, "sub", "other.jpg"), index)
+
+
+class GetImagesTest(unittest.TestCase):
+    def test_matches_extensions_only(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("a.JPG", "b.nef", "jpg", "nef", "notes.txt"):
+                open(os.path.join(directory, name), "wb").close()
+            found = sorted(os.path.basename(path) for chunk in get_images(directory) for path in chunk)
+        self.assertEqual(found, ["a.JPG", "b.nef"])
+
+
+class GetFreePathTest(unittest.TestCase):
+    def test_name_moved_out_is_free_again(self):
+        with tempfile.TemporaryDirectory() as root:
+            source = os.path.join(root, "source")
+            deleted = os.path.join(root, "deleted")
+            os.mkdir(source)
+            os.mkdir(deleted)
+            original = os.path.join(source, "a.jpg")
+            open(original, "wb").close()
+            
+            # Delete, undo, delete again
+            path = move_file(original, get_free_path(deleted, "a.jpg"))
+            move_file(path, original)
+            self.assertEqual(get_free_path(deleted, "a.jpg"), os.path.join(deleted, "a.jpg"))
+
+    def test_skips_existing_and_reserved(self):
+        with tempfile.TemporaryDirectory() as directory:
+            open(os.path.join(directory, "a.jpg"), "wb").close()
+            reserved = {os.path.join(directory, "a_1.jpg")}
+            self.assertEqual(get_free_path(directory, "a.jpg", reserved), os.path.join(directory, "a_2.jpg"))
+
+
+if __name__ == "__main__":
+    unittest.main()